@@ -7,6 +7,10 @@ import chess.engine
 
 from configs import EngineConfig, LimitConfig, SyzygyConfig
 
+MAX_GAMES_PER_PROCESS = 50
+IDLE_TIMEOUT = 600.0
+HEALTH_CHECK_TIMEOUT = 5.0
+
 
 class Engine:
     def __init__(
@@ -16,16 +20,26 @@ class Engine:
         ponder: bool,
         opponent: chess.engine.Opponent,
         limit_config: LimitConfig,
+        engine_key: str = "",
+        syzygy_config: SyzygyConfig | None = None,
     ) -> None:
         self.transport = transport
         self.engine = engine
         self.ponder = ponder
         self.opponent = opponent
         self.limit_config = limit_config
+        self.engine_key = engine_key
+        self.syzygy_config = syzygy_config
+        self.game = object()
+        self.games_played = 0
 
     @classmethod
     async def from_config(
-        cls, engine_config: EngineConfig, syzygy_config: SyzygyConfig, opponent: chess.engine.Opponent
+        cls,
+        engine_config: EngineConfig,
+        syzygy_config: SyzygyConfig,
+        opponent: chess.engine.Opponent,
+        engine_key: str = "",
     ) -> "Engine":
         stderr = subprocess.DEVNULL if engine_config.silence_stderr else None
 
@@ -34,7 +48,9 @@ class Engine:
         await cls._configure_engine(engine, engine_config, syzygy_config)
         await engine.send_opponent_information(opponent=opponent)
 
-        return cls(transport, engine, engine_config.ponder, opponent, engine_config.limits)
+        return cls(
+            transport, engine, engine_config.ponder, opponent, engine_config.limits, engine_key, syzygy_config
+        )
 
     @classmethod
     async def test(cls, engine_config: EngineConfig) -> None:
@@ -98,7 +114,7 @@ class Engine:
             )
             ponder = self.ponder
 
-        result = await self.engine.play(board, limit, info=chess.engine.INFO_ALL, ponder=ponder)
+        result = await self.engine.play(board, limit, info=chess.engine.INFO_ALL, ponder=ponder, game=self.game)
 
         if not result.move:
             raise RuntimeError("Engine could not make a move!")
@@ -107,12 +123,30 @@ class Engine:
 
     async def start_pondering(self, board: chess.Board) -> None:
         if self.ponder:
-            await self.engine.analysis(board)
+            await self.engine.analysis(board, game=self.game)
 
     async def stop_pondering(self, board: chess.Board) -> None:
         if self.ponder:
             self.ponder = False
-            await self.engine.analysis(board, chess.engine.Limit(time=0.001))
+            await self.engine.analysis(board, chess.engine.Limit(time=0.001), game=self.game)
+
+    async def reset(self, engine_config: EngineConfig, opponent: chess.engine.Opponent) -> None:
+        self.game = object()
+        self.ponder = engine_config.ponder
+        self.opponent = opponent
+        self.limit_config = engine_config.limits
+        await self.engine.send_opponent_information(opponent=opponent)
+
+    async def is_healthy(self) -> bool:
+        if self.transport.get_returncode() is not None:
+            return False
+
+        try:
+            await asyncio.wait_for(self.engine.ping(), HEALTH_CHECK_TIMEOUT)
+        except (TimeoutError, chess.engine.EngineError, chess.engine.EngineTerminatedError):
+            return False
+
+        return True
 
     async def close(self) -> None:
         try:
@@ -121,3 +155,74 @@ class Engine:
             print("Engine could not be terminated cleanly.")
 
         self.transport.close()
+
+
+class EnginePool:
+    def __init__(
+        self, max_games_per_process: int = MAX_GAMES_PER_PROCESS, idle_timeout: float = IDLE_TIMEOUT
+    ) -> None:
+        self.max_games_per_process = max_games_per_process
+        self.idle_timeout = idle_timeout
+        self.idle_engines: dict[str, list[Engine]] = {}
+        self.expiry_tasks: dict[Engine, asyncio.Task[None]] = {}
+        self.is_closing = False
+
+    async def checkout(
+        self,
+        engine_key: str,
+        engine_config: EngineConfig,
+        syzygy_config: SyzygyConfig,
+        opponent: chess.engine.Opponent,
+    ) -> Engine:
+        while engine := self._pop_idle_engine(engine_key, syzygy_config):
+            if not await engine.is_healthy():
+                print(f'Discarding unresponsive engine "{engine_key}".')
+                await engine.close()
+                continue
+
+            await engine.reset(engine_config, opponent)
+            return engine
+
+        return await Engine.from_config(engine_config, syzygy_config, opponent, engine_key)
+
+    async def checkin(self, engine: Engine) -> None:
+        engine.games_played += 1
+
+        if self.is_closing or engine.games_played >= self.max_games_per_process or not await engine.is_healthy():
+            await engine.close()
+            return
+
+        # Idle engines hold no per-game state: reset() sets opponent, ponder, limits and game token on checkout.
+        engine.ponder = False
+        self.idle_engines.setdefault(engine.engine_key, []).append(engine)
+        self.expiry_tasks[engine] = asyncio.create_task(self._expire(engine))
+
+    async def close(self) -> None:
+        self.is_closing = True
+
+        for task in self.expiry_tasks.values():
+            task.cancel()
+        self.expiry_tasks.clear()
+
+        for engines in self.idle_engines.values():
+            for engine in engines:
+                await engine.close()
+        self.idle_engines.clear()
+
+    def _pop_idle_engine(self, engine_key: str, syzygy_config: SyzygyConfig) -> Engine | None:
+        engines = self.idle_engines.get(engine_key, [])
+        for engine in reversed(engines):
+            if engine.syzygy_config == syzygy_config:
+                engines.remove(engine)
+                self.expiry_tasks.pop(engine).cancel()
+                return engine
+
+    async def _expire(self, engine: Engine) -> None:
+        await asyncio.sleep(self.idle_timeout)
+
+        self.expiry_tasks.pop(engine, None)
+        self.idle_engines[engine.engine_key].remove(engine)
+        try:
+            await engine.close()
+        except chess.engine.EngineTerminatedError:
+            print(f'Idle engine "{engine.engine_key}" had already terminated.')
@@ -1,238 +1,2370 @@
 #!/usr/bin/env python3
 
-import chess
+from __future__ import annotations
+
+import contextlib
+import functools
+import marshal
+import math
+import os
+import random
 import sys
-import time
 import threading
-from collections import defaultdict, namedtuple
+import time
+from collections import namedtuple
+
+# python-chess (~0.1 с на импорт), multiprocessing и таблицы дальнобойных фигур грузятся лениво:
+# движок запускается на каждую партию, и uci должен получить ответ сразу. Модуль chess подставляет
+# load_chess(), таблицы — load_slider_tables(); обе вместе — load_deferred().
+chess = None
+
+
+def load_chess():
+    """Импорт python-chess в глобальное имя chess; повторный вызов ничего не стоит."""
+    global chess  # noqa: PLW0603 — ленивый импорт: имя chess подставляется при первом вызове
+    import chess as chess_module  # noqa: PLC0415 — ленивый импорт python-chess ради быстрого uci
+    chess = chess_module
+
 
 INF = 99999999
 
+# типы фигур — те же числа, что chess.PAWN..chess.KING, но без импорта python-chess
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+PIECE_TYPES = range(1, 7)
+
 PIECE_VALUES = {
-    chess.PAWN: 100,
-    chess.KNIGHT: 320,
-    chess.BISHOP: 330,
-    chess.ROOK: 500,
-    chess.QUEEN: 900,
-    chess.KING: 20000
+    PAWN: 100,
+    KNIGHT: 320,
+    BISHOP: 330,
+    ROOK: 500,
+    QUEEN: 900,
+    KING: 20000
 }
 
-# Небольшие PST для примера
-PST = {
-    chess.PAWN: [
-         0,  0,  0,  0,  0,  0,  0,  0,
-         5, 10, 10,-20,-20, 10, 10,  5,
-         5, -5,-10,  0,  0,-10, -5,  5,
-         0,  0,  0, 20, 20,  0,  0,  0,
-         5,  5, 10, 25, 25, 10,  5,  5,
-        10, 10, 20, 30, 30, 20, 10, 10,
-        50, 50, 50, 50, 50, 50, 50, 50,
-         0,  0,  0,  0,  0,  0,  0,  0
+# Материал и PST по фазам: MG — миттельшпиль, EG — эндшпиль (значения PeSTO).
+# PIECE_VALUES остаются для SEE и сортировки ходов.
+MG_VALUES = {
+    PAWN: 82,
+    KNIGHT: 337,
+    BISHOP: 365,
+    ROOK: 477,
+    QUEEN: 1025,
+    KING: 0
+}
+EG_VALUES = {
+    PAWN: 94,
+    KNIGHT: 281,
+    BISHOP: 297,
+    ROOK: 512,
+    QUEEN: 936,
+    KING: 0
+}
+
+# Таблицы записаны от a1 (первая строка — 1-я горизонталь), со стороны белых
+PST_MG = {
+    PAWN: [
+           0,   0,   0,   0,   0,   0,   0,   0,
+         -35,  -1, -20, -23, -15,  24,  38, -22,
+         -26,  -4,  -4, -10,   3,   3,  33, -12,
+         -27,  -2,  -5,  12,  17,   6,  10, -25,
+         -14,  13,   6,  21,  23,  12,  17, -23,
+          -6,   7,  26,  31,  65,  56,  25, -20,
+          98, 134,  61,  95,  68, 126,  34, -11,
+           0,   0,   0,   0,   0,   0,   0,   0,
+    ],
+    KNIGHT: [
+        -105, -21, -58, -33, -17, -28, -19, -23,
+         -29, -53, -12,  -3,  -1,  18, -14, -19,
+         -23,  -9,  12,  10,  19,  17,  25, -16,
+         -13,   4,  16,  13,  28,  19,  21,  -8,
+          -9,  17,  19,  53,  37,  69,  18,  22,
+         -47,  60,  37,  65,  84, 129,  73,  44,
+         -73, -41,  72,  36,  23,  62,   7, -17,
+        -167, -89, -34, -49,  61, -97, -15,-107,
+    ],
+    BISHOP: [
+         -33,  -3, -14, -21, -13, -12, -39, -21,
+           4,  15,  16,   0,   7,  21,  33,   1,
+           0,  15,  15,  15,  14,  27,  18,  10,
+          -6,  13,  13,  26,  34,  12,  10,   4,
+          -4,   5,  19,  50,  37,  37,   7,  -2,
+         -16,  37,  43,  40,  35,  50,  37,  -2,
+         -26,  16, -18, -13,  30,  59,  18, -47,
+         -29,   4, -82, -37, -25, -42,   7,  -8,
+    ],
+    ROOK: [
+         -19, -13,   1,  17,  16,   7, -37, -26,
+         -44, -16, -20,  -9,  -1,  11,  -6, -71,
+         -45, -25, -16, -17,   3,   0,  -5, -33,
+         -36, -26, -12,  -1,   9,  -7,   6, -23,
+         -24, -11,   7,  26,  24,  35,  -8, -20,
+          -5,  19,  26,  36,  17,  45,  61,  16,
+          27,  32,  58,  62,  80,  67,  26,  44,
+          32,  42,  32,  51,  63,   9,  31,  43,
+    ],
+    QUEEN: [
+          -1, -18,  -9,  10, -15, -25, -31, -50,
+         -35,  -8,  11,   2,   8,  15,  -3,   1,
+         -14,   2, -11,  -2,  -5,   2,  14,   5,
+          -9, -26,  -9, -10,  -2,  -4,   3,  -3,
+         -27, -27, -16, -16,  -1,  17,  -2,   1,
+         -13, -17,   7,   8,  29,  56,  47,  57,
+         -24, -39,  -5,   1, -16,  57,  28,  54,
+         -28,   0,  29,  12,  59,  44,  43,  45,
+    ],
+    KING: [
+         -15,  36,  12, -54,   8, -28,  24,  14,
+           1,   7,  -8, -64, -43, -16,   9,   8,
+         -14, -14, -22, -46, -44, -30, -15, -27,
+         -49,  -1, -27, -39, -46, -44, -33, -51,
+         -17, -20, -12, -27, -30, -25, -14, -36,
+          -9,  24,   2, -16, -20,   6,  22, -22,
+          29,  -1, -20,  -7,  -8,  -4, -38, -29,
+         -65,  23,  16, -15, -56, -34,   2,  13,
+    ],
+}
+
+PST_EG = {
+    PAWN: [
+           0,   0,   0,   0,   0,   0,   0,   0,
+          13,   8,   8,  10,  13,   0,   2,  -7,
+           4,   7,  -6,   1,   0,  -5,  -1,  -8,
+          13,   9,  -3,  -7,  -7,  -8,   3,  -1,
+          32,  24,  13,   5,  -2,   4,  17,  17,
+          94, 100,  85,  67,  56,  53,  82,  84,
+         178, 173, 158, 134, 147, 132, 165, 187,
+           0,   0,   0,   0,   0,   0,   0,   0,
+    ],
+    KNIGHT: [
+         -29, -51, -23, -15, -22, -18, -50, -64,
+         -42, -20, -10,  -5,  -2, -20, -23, -44,
+         -23,  -3,  -1,  15,  10,  -3, -20, -22,
+         -18,  -6,  16,  25,  16,  17,   4, -18,
+         -17,   3,  22,  22,  22,  11,   8, -18,
+         -24, -20,  10,   9,  -1,  -9, -19, -41,
+         -25,  -8, -25,  -2,  -9, -25, -24, -52,
+         -58, -38, -13, -28, -31, -27, -63, -99,
+    ],
+    BISHOP: [
+         -23,  -9, -23,  -5,  -9, -16,  -5, -17,
+         -14, -18,  -7,  -1,   4,  -9, -15, -27,
+         -12,  -3,   8,  10,  13,   3,  -7, -15,
+          -6,   3,  13,  19,   7,  10,  -3,  -9,
+          -3,   9,  12,   9,  14,  10,   3,   2,
+           2,  -8,   0,  -1,  -2,   6,   0,   4,
+          -8,  -4,   7, -12,  -3, -13,  -4, -14,
+         -14, -21, -11,  -8,  -7,  -9, -17, -24,
+    ],
+    ROOK: [
+          -9,   2,   3,  -1,  -5, -13,   4, -20,
+          -6,  -6,   0,   2,  -9,  -9, -11,  -3,
+          -4,   0,  -5,  -1,  -7, -12,  -8, -16,
+           3,   5,   8,   4,  -5,  -6,  -8, -11,
+           4,   3,  13,   1,   2,   1,  -1,   2,
+           7,   7,   7,   5,   4,  -3,  -5,  -3,
+          11,  13,  13,  11,  -3,   3,   8,   3,
+          13,  10,  18,  15,  12,  12,   8,   5,
+    ],
+    QUEEN: [
+         -33, -28, -22, -43,  -5, -32, -20, -41,
+         -22, -23, -30, -16, -16, -23, -36, -32,
+         -16, -27,  15,   6,   9,  17,  10,   5,
+         -18,  28,  19,  47,  31,  34,  39,  23,
+           3,  22,  24,  45,  57,  40,  57,  36,
+         -20,   6,   9,  49,  47,  35,  19,   9,
+         -17,  20,  32,  41,  58,  25,  30,   0,
+          -9,  22,  22,  27,  27,  19,  10,  20,
+    ],
+    KING: [
+         -53, -34, -21, -11, -28, -14, -24, -43,
+         -27, -11,   4,  13,  14,   4,  -5, -17,
+         -19,  -3,  11,  21,  23,  16,   7,  -9,
+         -18,  -4,  21,  24,  27,  23,   9, -11,
+          -8,  22,  24,  27,  26,  33,  26,   3,
+          10,  17,  23,  15,  20,  45,  44,  13,
+         -12,  17,  14,  17,  17,  38,  23,  11,
+         -74, -35, -18, -18, -11,  15,   4, -17,
     ],
-    chess.KNIGHT: [
-        -50,-40,-30,-30,-30,-30,-40,-50,
-        -40,-20,  0,  5,  5,  0,-20,-40,
-        -30,  5, 10, 15, 15, 10,  5,-30,
-        -30,  0, 15, 20, 20, 15,  0,-30,
-        -30,  5, 15, 20, 20, 15,  5,-30,
-        -30,  0, 10, 15, 15, 10,  0,-30,
-        -40,-20,  0,  0,  0,  0,-20,-40,
-        -50,-40,-30,-30,-30,-30,-40,-50
-    ]
 }
 
 TTEntry = namedtuple("TTEntry", ["depth", "flag", "score", "best_move"])
-# flag: 'EXACT', 'LOWER', 'UPPER'
+# flag: TT_EXACT, TT_LOWER, TT_UPPER (0 — пустой слот)
+TT_EXACT = 1
+TT_LOWER = 2
+TT_UPPER = 3
+
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 4096
+MAX_THREADS = 64
+DEFAULT_MOVE_OVERHEAD = 100
+MAX_MOVE_OVERHEAD = 5000
+MAX_MULTIPV = 256
+
+# ---- Битборды и таблицы атак ----
+# Поиск работает на собственной доске (Position); python-chess нужен только на границе UCI.
+
+WHITE = 0
+BLACK = 1
+
+BB_FILE_A = 0x0101010101010101
+BB_FILE_H = BB_FILE_A << 7
+BB_RANK_1 = 0xFF
+BB_RANK_3 = 0xFF << 16
+BB_RANK_6 = 0xFF << 40
+BB_RANK_8 = 0xFF << 56
+BB_LIGHT_SQUARES = 0x55AA55AA55AA55AA
+BB_DARK_SQUARES = 0xAA55AA55AA55AA55
+
+
+def _step_attacks(deltas):
+    table = []
+    for sq in range(64):
+        rank, file = divmod(sq, 8)
+        bb = 0
+        for dr, df in deltas:
+            r, f = rank + dr, file + df
+            if 0 <= r < 8 and 0 <= f < 8:
+                bb |= 1 << (r * 8 + f)
+        table.append(bb)
+    return table
+
+
+def _slider_attacks(sq, directions, occupied):
+    rank, file = divmod(sq, 8)
+    bb = 0
+    for dr, df in directions:
+        r, f = rank + dr, file + df
+        while 0 <= r < 8 and 0 <= f < 8:
+            bit = 1 << (r * 8 + f)
+            bb |= bit
+            if occupied & bit:
+                break
+            r += dr
+            f += df
+    return bb
+
+
+def _slider_tables(directions):
+    """
+    Для каждого поля: маска значимых блокеров (без краевых полей) и словарь
+    «занятость под маской -> атаки». Словарь играет роль идеального хэша magic-таблиц:
+    в Python умножение на magic-число дороже, чем поиск по int-ключу.
+    """
+    masks = []
+    tables = []
+    for sq in range(64):
+        rank, file = divmod(sq, 8)
+        mask = 0
+        for dr, df in directions:
+            r, f = rank + dr, file + df
+            while 0 <= r + dr < 8 and 0 <= f + df < 8:
+                mask |= 1 << (r * 8 + f)
+                r += dr
+                f += df
+        table = {}
+        subset = 0
+        while True:
+            table[subset] = _slider_attacks(sq, directions, subset)
+            subset = (subset - mask) & mask
+            if not subset:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+KNIGHT_ATTACKS = _step_attacks([(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+KING_ATTACKS = _step_attacks([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+# PAWN_ATTACKS[color][sq] — поля, которые бьёт пешка цвета color с поля sq
+PAWN_ATTACKS = [_step_attacks([(1, -1), (1, 1)]), _step_attacks([(-1, -1), (-1, 1)])]
+
+# Таблицы дальнобойных фигур строятся заметно дольше остального старта, поэтому
+# сохраняются в кэш-файл рядом со скриптом (marshal) и загружаются не при импорте,
+# а в load_slider_tables(): в UCI — в фоне, пока GUI проходит рукопожатие.
+TABLE_CACHE_VERSION = 1
+TABLE_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "__pycache__",
+    f"DarkOnEngine.tables.{sys.implementation.cache_tag}.bin",
+)
+
+
+def _load_slider_tables():
+    """((маски, атаки) для диагоналей, горизонталей, вертикалей) — из кэша или заново с записью кэша."""
+    try:
+        with open(TABLE_CACHE_PATH, "rb") as f:
+            version, tables = marshal.load(f)
+        if version == TABLE_CACHE_VERSION:
+            return tables
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+
+    tables = (
+        _slider_tables([(1, 1), (1, -1), (-1, 1), (-1, -1)]),
+        _slider_tables([(0, 1), (0, -1)]),
+        _slider_tables([(1, 0), (-1, 0)]),
+    )
+    # кэш — только ускорение: каталог может быть недоступен для записи
+    try:
+        os.makedirs(os.path.dirname(TABLE_CACHE_PATH), exist_ok=True)
+        tmp_path = f"{TABLE_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            marshal.dump((TABLE_CACHE_VERSION, tables), f)
+        os.replace(tmp_path, TABLE_CACHE_PATH)
+    except OSError:
+        pass
+    return tables
+
+
+DIAG_MASKS = DIAG_ATTACKS = RANK_MASKS = RANK_ATTACKS = FILE_MASKS = FILE_ATTACKS = None
+
+
+def load_slider_tables():
+    """Заполняет глобальные таблицы дальнобойных фигур; повторный вызов ничего не стоит."""
+    global DIAG_MASKS, DIAG_ATTACKS, RANK_MASKS, RANK_ATTACKS, FILE_MASKS, FILE_ATTACKS
+    if DIAG_ATTACKS is not None:
+        return
+    (DIAG_MASKS, DIAG_ATTACKS), (RANK_MASKS, RANK_ATTACKS), (FILE_MASKS, FILE_ATTACKS) = _load_slider_tables()
+
+
+def load_deferred():
+    """Всё, что отложено с импорта: python-chess и таблицы дальнобойных фигур."""
+    load_chess()
+    load_slider_tables()
+
+
+# ---- Zobrist ----
+# Ключи генерируются детерминированно, чтобы хэш позиции не менялся между запусками.
+
+_zobrist_rng = random.Random(0x0DA7C0DE)
+# 12 фигур x 64 поля: индекс (piece_index * 64 + square)
+ZOBRIST_PIECE = [_zobrist_rng.getrandbits(64) for _ in range(12 * 64)]
+# по 4-битной маске прав на рокировку
+ZOBRIST_CASTLING = [_zobrist_rng.getrandbits(64) for _ in range(16)]
+ZOBRIST_EP = [_zobrist_rng.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK = _zobrist_rng.getrandbits(64)
+
+
+def piece_index(color: int, piece_type: int) -> int:
+    """0-5 — белые P N B R Q K, 6-11 — чёрные (color: WHITE/BLACK этого модуля)."""
+    return piece_type - 1 + 6 * color
+
+# ---- Ходы ----
+# Ход — int: биты 0-5 откуда, 6-11 куда, 12-14 фигура превращения, 15-16 флаг.
+# Рокировка кодируется как «король берёт свою ладью» — так же для chess960.
+
+MOVE_NORMAL = 0
+MOVE_EP = 1
+MOVE_CASTLE = 2
+
+EP_FLAG = MOVE_EP << 15
+CASTLE_FLAG = MOVE_CASTLE << 15
+
+# упаковка состояния для отката хода
+_UNDO_PSQ_OFFSET = 1 << 32
+
+# стоимость фигур для SEE по типу 0-5 (пешка..король)
+SEE_VALUES = [PIECE_VALUES[pt] for pt in PIECE_TYPES]
+
+
+class Position:
+    """
+    Доска для поиска: 12 битбордов фигур, массив-«почтовый ящик» на 64 поля,
+    инкрементальные Zobrist-ключи (полный и пешечный) и материал+PST.
+    Генерация псевдолегальная,
+    легальность проверяется после make(). Откат — по стеку упакованных int.
+    """
+
+    def __init__(self):
+        self.bb = [0] * 12
+        self.occ = [0, 0]
+        self.occupied = 0
+        self.mailbox = [-1] * 64
+        self.kings = [0, 0]
+        self.side = WHITE
+        self.castling = 0
+        self.ep = -1
+        self.halfmove = 0
+        self.fullmove = 1
+        self.key = 0
+        # ключ только по пешкам — для пешечного хэша оценки
+        self.pawn_key = 0
+        # MG и EG в одном int, см. mg_eg()
+        self.psq = 0
+        self.chess960 = False
+        # поле ладьи для каждого из четырёх прав; маска прав, сохраняемых при ходе с/на поле
+        self.castle_rooks = [-1] * 4
+        self.castle_mask = [15] * 64
+        self.undo = []
+        # ключи всех предыдущих позиций — для отката и поиска повторений
+        self.keys = []
+        # аккумуляторы NNUE (None — ручная оценка)
+        self.nnue = None
+
+    @classmethod
+    def from_board(cls, board: chess.Board) -> Position:
+        """Строит позицию из корня партии и проигрывает историю, чтобы видеть повторения."""
+        root = board.root()
+        pos = cls()
+        pos.chess960 = board.chess960
+        for sq, piece in root.piece_map().items():
+            pos._put(piece_index(WHITE if piece.color else BLACK, piece.piece_type), sq)
+        pos.side = WHITE if root.turn else BLACK
+        pos.halfmove = min(root.halfmove_clock, 1023)
+        pos.fullmove = root.fullmove_number
+
+        for rook_sq in chess.scan_forward(root.clean_castling_rights()):
+            color = WHITE if rook_sq < 8 else BLACK
+            king_sq = pos.kings[color]
+            idx = 2 * color + (0 if rook_sq > king_sq else 1)
+            pos.castle_rooks[idx] = rook_sq
+            pos.castling |= 1 << idx
+            pos.castle_mask[rook_sq] &= ~(1 << idx)
+            pos.castle_mask[king_sq] &= ~(3 << (2 * color))
+
+        ep = root.ep_square
+        if ep is not None and PAWN_ATTACKS[pos.side ^ 1][ep] & pos.bb[piece_index(pos.side, PAWN)]:
+            pos.ep = ep
+
+        pos.key = pos.compute_key()
+        pos.pawn_key = pos.compute_pawn_key()
+        pos.psq = pos.compute_psq()
+
+        for move in board.move_stack:
+            pos.make(pos.from_chess_move(move))
+        return pos
+
+    def set_network(self, network):
+        """Подключает сеть к текущей позиции; дальше аккумулятор ведут make/unmake."""
+        self.nnue = NnueAccumulator(network, self) if network is not None else None
+
+    def _put(self, piece: int, sq: int):
+        bit = 1 << sq
+        self.bb[piece] |= bit
+        self.occ[piece // 6] |= bit
+        self.occupied |= bit
+        self.mailbox[sq] = piece
+        if piece % 6 == 5:
+            self.kings[piece // 6] = sq
+
+    def compute_key(self) -> int:
+        key = 0
+        for sq in range(64):
+            if self.mailbox[sq] >= 0:
+                key ^= ZOBRIST_PIECE[self.mailbox[sq] * 64 + sq]
+        key ^= ZOBRIST_CASTLING[self.castling]
+        if self.ep >= 0:
+            key ^= ZOBRIST_EP[self.ep & 7]
+        if self.side == BLACK:
+            key ^= ZOBRIST_BLACK
+        return key
+
+    def compute_pawn_key(self) -> int:
+        key = 0
+        for piece in (0, 6):
+            pawns = self.bb[piece]
+            while pawns:
+                lsb = pawns & -pawns
+                pawns ^= lsb
+                key ^= ZOBRIST_PIECE[piece * 64 + lsb.bit_length() - 1]
+        return key
+
+    def compute_psq(self) -> int:
+        return sum(PSQ_TABLE[p * 64 + sq] for sq, p in enumerate(self.mailbox) if p >= 0)
+
+    # ---- атаки ----
+
+    def is_attacked(self, sq: int, by: int) -> bool:
+        bb = self.bb
+        o = 6 * by
+        if PAWN_ATTACKS[by ^ 1][sq] & bb[o]:
+            return True
+        if KNIGHT_ATTACKS[sq] & bb[o + 1]:
+            return True
+        if KING_ATTACKS[sq] & bb[o + 5]:
+            return True
+        occupied = self.occupied
+        queens = bb[o + 4]
+        diag = bb[o + 2] | queens
+        if diag and DIAG_ATTACKS[sq][occupied & DIAG_MASKS[sq]] & diag:
+            return True
+        line = bb[o + 3] | queens
+        if line and (
+            RANK_ATTACKS[sq][occupied & RANK_MASKS[sq]] | FILE_ATTACKS[sq][occupied & FILE_MASKS[sq]]
+        ) & line:
+            return True
+        return False
+
+    def in_check(self) -> bool:
+        return self.is_attacked(self.kings[self.side], self.side ^ 1)
+
+    def attackers_to(self, sq: int, occupied: int) -> int:
+        """Все фигуры обоих цветов, бьющие поле sq при заданной занятости."""
+        bb = self.bb
+        return (
+            (PAWN_ATTACKS[BLACK][sq] & bb[0])
+            | (PAWN_ATTACKS[WHITE][sq] & bb[6])
+            | (KNIGHT_ATTACKS[sq] & (bb[1] | bb[7]))
+            | (KING_ATTACKS[sq] & (bb[5] | bb[11]))
+            | (DIAG_ATTACKS[sq][occupied & DIAG_MASKS[sq]] & (bb[2] | bb[4] | bb[8] | bb[10]))
+            | (
+                (RANK_ATTACKS[sq][occupied & RANK_MASKS[sq]] | FILE_ATTACKS[sq][occupied & FILE_MASKS[sq]])
+                & (bb[3] | bb[4] | bb[9] | bb[10])
+            )
+        )
+
+    def see_ge(self, move: int, threshold: int = 0) -> bool:
+        """
+        Static exchange evaluation: не хуже ли threshold размен на поле хода, если
+        каждая сторона бьёт наименее ценной фигурой. Рентген сквозь ушедших слонов,
+        ладей и ферзей учитывается; связки — нет.
+        """
+        flag = move >> 15
+        if flag == MOVE_CASTLE:
+            return threshold <= 0
+        frm = move & 63
+        to = (move >> 6) & 63
+        promo = (move >> 12) & 7
+        bb = self.bb
+        mailbox = self.mailbox
+
+        occupied = self.occupied ^ (1 << frm)
+        if flag == MOVE_EP:
+            gain = SEE_VALUES[0]
+            occupied ^= 1 << (to - 8 if self.side == WHITE else to + 8)
+        else:
+            victim = mailbox[to]
+            gain = SEE_VALUES[victim % 6] if victim >= 0 else 0
+        if promo:
+            gain += SEE_VALUES[promo - 1] - SEE_VALUES[0]
+            on_square = SEE_VALUES[promo - 1]
+        else:
+            on_square = SEE_VALUES[mailbox[frm] % 6]
+
+        swap = gain - threshold
+        if swap < 0:
+            return False
+        swap = on_square - swap
+        if swap <= 0:
+            return True
+
+        occupied |= 1 << to
+        diag = bb[2] | bb[4] | bb[8] | bb[10]
+        line = bb[3] | bb[4] | bb[9] | bb[10]
+        attackers = self.attackers_to(to, occupied)
+        stm = self.side
+        res = 1
+        while True:
+            stm ^= 1
+            attackers &= occupied
+            stm_attackers = attackers & self.occ[stm]
+            if not stm_attackers:
+                break
+            res ^= 1
+            base = 6 * stm
+            for pt in range(6):
+                found = stm_attackers & bb[base + pt]
+                if found:
+                    break
+            if pt == 5:
+                # королём бить можно, только если поле больше никто не защищает
+                return bool(res ^ 1) if attackers & self.occ[stm ^ 1] else bool(res)
+            swap = SEE_VALUES[pt] - swap
+            if swap < res:
+                break
+            occupied ^= found & -found
+            if pt in (0, 2, 4):
+                attackers |= DIAG_ATTACKS[to][occupied & DIAG_MASKS[to]] & diag
+            if pt in (3, 4):
+                attackers |= (
+                    RANK_ATTACKS[to][occupied & RANK_MASKS[to]] | FILE_ATTACKS[to][occupied & FILE_MASKS[to]]
+                ) & line
+        return bool(res)
+
+    # ---- генерация ----
+
+    def gen_noisy(self, moves: list):
+        """Взятия (включая en passant и взятия с превращением) и превращения в ферзя."""
+        us = self.side
+        o = 6 * us
+        bb = self.bb
+        enemy = self.occ[us ^ 1]
+        empty = ~self.occupied
+        pawns = bb[o]
+
+        if us == WHITE:
+            left = ((pawns & ~BB_FILE_A) << 7) & enemy
+            right = ((pawns & ~BB_FILE_H) << 9) & enemy
+            push = (pawns << 8) & empty & BB_RANK_8
+            left_d, right_d, push_d, last_rank = 7, 9, 8, BB_RANK_8
+        else:
+            left = ((pawns & ~BB_FILE_A) >> 9) & enemy
+            right = ((pawns & ~BB_FILE_H) >> 7) & enemy
+            push = (pawns >> 8) & empty & BB_RANK_1
+            left_d, right_d, push_d, last_rank = -9, -7, -8, BB_RANK_1
+
+        for captures, delta in ((left, left_d), (right, right_d)):
+            targets = captures
+            while targets:
+                lsb = targets & -targets
+                to = lsb.bit_length() - 1
+                targets ^= lsb
+                move = (to - delta) | (to << 6)
+                if lsb & last_rank:
+                    moves.append(move | (5 << 12))
+                    moves.append(move | (4 << 12))
+                    moves.append(move | (3 << 12))
+                    moves.append(move | (2 << 12))
+                else:
+                    moves.append(move)
+        while push:
+            lsb = push & -push
+            to = lsb.bit_length() - 1
+            push ^= lsb
+            moves.append((to - push_d) | (to << 6) | (5 << 12))
+
+        if self.ep >= 0:
+            attackers = PAWN_ATTACKS[us ^ 1][self.ep] & pawns
+            while attackers:
+                lsb = attackers & -attackers
+                attackers ^= lsb
+                moves.append((lsb.bit_length() - 1) | (self.ep << 6) | EP_FLAG)
+
+        self._gen_pieces(moves, enemy)
+
+    def gen_quiet(self, moves: list):
+        """Тихие ходы: продвижения пешек, слабые превращения, ходы фигур на пустые поля, рокировки."""
+        us = self.side
+        o = 6 * us
+        bb = self.bb
+        empty = ~self.occupied
+        pawns = bb[o]
+
+        if us == WHITE:
+            single = (pawns << 8) & empty
+            double = ((single & BB_RANK_3) << 8) & empty
+            delta, last_rank = 8, BB_RANK_8
+        else:
+            single = (pawns >> 8) & empty
+            double = ((single & BB_RANK_6) >> 8) & empty
+            delta, last_rank = -8, BB_RANK_1
+
+        while single:
+            lsb = single & -single
+            to = lsb.bit_length() - 1
+            single ^= lsb
+            move = (to - delta) | (to << 6)
+            if lsb & last_rank:
+                moves.append(move | (4 << 12))
+                moves.append(move | (3 << 12))
+                moves.append(move | (2 << 12))
+            else:
+                moves.append(move)
+        while double:
+            lsb = double & -double
+            to = lsb.bit_length() - 1
+            double ^= lsb
+            moves.append((to - 2 * delta) | (to << 6))
+
+        self._gen_pieces(moves, empty & 0xFFFFFFFFFFFFFFFF)
+
+        if self.castling & (3 << (2 * us)):
+            self._gen_castling(moves)
+
+    def _gen_pieces(self, moves: list, target_mask: int):
+        us = self.side
+        o = 6 * us
+        bb = self.bb
+        occupied = self.occupied
+
+        for piece in (o + 1, o + 2, o + 3, o + 4, o + 5):
+            pieces = bb[piece]
+            while pieces:
+                lsb = pieces & -pieces
+                frm = lsb.bit_length() - 1
+                pieces ^= lsb
+                if piece == o + 1:
+                    targets = KNIGHT_ATTACKS[frm]
+                elif piece == o + 2:
+                    targets = DIAG_ATTACKS[frm][occupied & DIAG_MASKS[frm]]
+                elif piece == o + 3:
+                    targets = (
+                        RANK_ATTACKS[frm][occupied & RANK_MASKS[frm]] | FILE_ATTACKS[frm][occupied & FILE_MASKS[frm]]
+                    )
+                elif piece == o + 4:
+                    targets = (
+                        DIAG_ATTACKS[frm][occupied & DIAG_MASKS[frm]]
+                        | RANK_ATTACKS[frm][occupied & RANK_MASKS[frm]]
+                        | FILE_ATTACKS[frm][occupied & FILE_MASKS[frm]]
+                    )
+                else:
+                    targets = KING_ATTACKS[frm]
+                targets &= target_mask
+                while targets:
+                    tlsb = targets & -targets
+                    targets ^= tlsb
+                    moves.append(frm | ((tlsb.bit_length() - 1) << 6))
+
+    def _gen_castling(self, moves: list):
+        us = self.side
+        them = us ^ 1
+        king_sq = self.kings[us]
+        base = 56 * us
+        for idx in (2 * us, 2 * us + 1):
+            if not self.castling & (1 << idx):
+                continue
+            rook_sq = self.castle_rooks[idx]
+            if idx & 1:
+                king_to, rook_to = base + 2, base + 3
+            else:
+                king_to, rook_to = base + 6, base + 5
+            king_path = _span(king_sq, king_to)
+            must_be_empty = (king_path | _span(rook_sq, rook_to)) & ~((1 << king_sq) | (1 << rook_sq))
+            if self.occupied & must_be_empty:
+                continue
+            path = king_path
+            blocked = False
+            while path:
+                lsb = path & -path
+                path ^= lsb
+                if self.is_attacked(lsb.bit_length() - 1, them):
+                    blocked = True
+                    break
+            if not blocked:
+                moves.append(king_sq | (rook_sq << 6) | CASTLE_FLAG)
+
+    def is_pseudo_legal(self, move: int) -> bool:
+        """Проверка хода из TT/killer-таблиц без генерации всего списка."""
+        frm = move & 63
+        to = (move >> 6) & 63
+        flag = move >> 15
+        promotion = (move >> 12) & 7
+        us = self.side
+        mailbox = self.mailbox
+        piece = mailbox[frm]
+        if piece < 0 or piece // 6 != us or frm == to:
+            return False
+
+        if flag == MOVE_CASTLE:
+            castles = []
+            if self.castling & (3 << (2 * us)):
+                self._gen_castling(castles)
+            return move in castles
+
+        if flag == MOVE_EP:
+            return piece == 6 * us and to == self.ep and bool(PAWN_ATTACKS[us][frm] & (1 << to)) and not promotion
+
+        target = mailbox[to]
+        if target >= 0 and target // 6 == us:
+            return False
+
+        if piece == 6 * us:
+            last_rank = BB_RANK_8 if us == WHITE else BB_RANK_1
+            if bool((1 << to) & last_rank) != bool(promotion) or promotion == 1 or promotion > 5:
+                return False
+            if PAWN_ATTACKS[us][frm] & (1 << to):
+                return target >= 0
+            step = 8 if us == WHITE else -8
+            if target >= 0:
+                return False
+            if to == frm + step:
+                return True
+            start_rank = 1 if us == WHITE else 6
+            return to == frm + 2 * step and frm >> 3 == start_rank and mailbox[frm + step] < 0
+
+        if promotion:
+            return False
+        kind = piece - 6 * us
+        occupied = self.occupied
+        if kind == 1:
+            attacks = KNIGHT_ATTACKS[frm]
+        elif kind == 2:
+            attacks = DIAG_ATTACKS[frm][occupied & DIAG_MASKS[frm]]
+        elif kind == 3:
+            attacks = RANK_ATTACKS[frm][occupied & RANK_MASKS[frm]] | FILE_ATTACKS[frm][occupied & FILE_MASKS[frm]]
+        elif kind == 4:
+            attacks = (
+                DIAG_ATTACKS[frm][occupied & DIAG_MASKS[frm]]
+                | RANK_ATTACKS[frm][occupied & RANK_MASKS[frm]]
+                | FILE_ATTACKS[frm][occupied & FILE_MASKS[frm]]
+            )
+        else:
+            attacks = KING_ATTACKS[frm]
+        return bool(attacks & (1 << to))
+
+    def pseudo_legal_moves(self) -> list:
+        moves = []
+        self.gen_noisy(moves)
+        self.gen_quiet(moves)
+        return moves
+
+    def legal_moves(self) -> list:
+        legal = []
+        for move in self.pseudo_legal_moves():
+            if self.make(move):
+                self.unmake(move)
+                legal.append(move)
+        return legal
+
+    def has_legal_move(self) -> bool:
+        for move in self.pseudo_legal_moves():
+            if self.make(move):
+                self.unmake(move)
+                return True
+        return False
+
+    # ---- make / unmake ----
+
+    def make(self, move: int) -> bool:
+        """Делает ход; если свой король остаётся под боем — откатывает и возвращает False."""
+        frm = move & 63
+        to = (move >> 6) & 63
+        flag = move >> 15
+        us = self.side
+        them = us ^ 1
+        bb = self.bb
+        occ = self.occ
+        mailbox = self.mailbox
+        piece = mailbox[frm]
+
+        if flag == MOVE_CASTLE:
+            captured = -1
+        elif flag == MOVE_EP:
+            captured = 6 * them
+        else:
+            captured = mailbox[to]
+
+        key = self.key
+        psq = self.psq
+        castling = self.castling
+        self.undo.append(
+            (captured + 1)
+            | (castling << 4)
+            | ((self.ep + 1) << 8)
+            | (self.halfmove << 15)
+            | ((psq + _UNDO_PSQ_OFFSET) << 25)
+        )
+        self.keys.append(key)
+
+        key ^= ZOBRIST_BLACK ^ ZOBRIST_CASTLING[castling]
+        if self.ep >= 0:
+            key ^= ZOBRIST_EP[self.ep & 7]
+        ep = -1
+        halfmove = self.halfmove + 1
+
+        if flag == MOVE_CASTLE:
+            rook = piece - 2
+            base = 56 * us
+            if to > frm:
+                king_to, rook_to = base + 6, base + 5
+            else:
+                king_to, rook_to = base + 2, base + 3
+            from_bits = (1 << frm) | (1 << to)
+            to_bits = (1 << king_to) | (1 << rook_to)
+            bb[piece] ^= 1 << frm
+            bb[rook] ^= 1 << to
+            occ[us] ^= from_bits
+            mailbox[frm] = -1
+            mailbox[to] = -1
+            bb[piece] |= 1 << king_to
+            bb[rook] |= 1 << rook_to
+            occ[us] |= to_bits
+            mailbox[king_to] = piece
+            mailbox[rook_to] = rook
+            key ^= (
+                ZOBRIST_PIECE[piece * 64 + frm] ^ ZOBRIST_PIECE[piece * 64 + king_to]
+                ^ ZOBRIST_PIECE[rook * 64 + to] ^ ZOBRIST_PIECE[rook * 64 + rook_to]
+            )
+            psq += (
+                PSQ_TABLE[piece * 64 + king_to] - PSQ_TABLE[piece * 64 + frm]
+                + PSQ_TABLE[rook * 64 + rook_to] - PSQ_TABLE[rook * 64 + to]
+            )
+            self.kings[us] = king_to
+        else:
+            from_bit = 1 << frm
+            to_bit = 1 << to
+            if captured >= 0:
+                cap_sq = to ^ 8 if flag == MOVE_EP else to
+                cap_bit = 1 << cap_sq
+                bb[captured] ^= cap_bit
+                occ[them] ^= cap_bit
+                mailbox[cap_sq] = -1
+                key ^= ZOBRIST_PIECE[captured * 64 + cap_sq]
+                psq -= PSQ_TABLE[captured * 64 + cap_sq]
+                if captured == 6 * them:
+                    self.pawn_key ^= ZOBRIST_PIECE[captured * 64 + cap_sq]
+                halfmove = 0
+            bb[piece] ^= from_bit
+            occ[us] ^= from_bit | to_bit
+            mailbox[frm] = -1
+            key ^= ZOBRIST_PIECE[piece * 64 + frm]
+            psq -= PSQ_TABLE[piece * 64 + frm]
+            promotion = (move >> 12) & 7
+            placed = 6 * us + promotion - 1 if promotion else piece
+            bb[placed] |= to_bit
+            mailbox[to] = placed
+            key ^= ZOBRIST_PIECE[placed * 64 + to]
+            psq += PSQ_TABLE[placed * 64 + to]
+            if piece == 6 * us:
+                halfmove = 0
+                self.pawn_key ^= ZOBRIST_PIECE[piece * 64 + frm]
+                if not promotion:
+                    self.pawn_key ^= ZOBRIST_PIECE[piece * 64 + to]
+                if to - frm == 16 or frm - to == 16:
+                    ep_sq = (frm + to) >> 1
+                    if PAWN_ATTACKS[us][ep_sq] & bb[6 * them]:
+                        ep = ep_sq
+                        key ^= ZOBRIST_EP[ep_sq & 7]
+            elif piece == 6 * us + 5:
+                self.kings[us] = to
+
+        castling &= self.castle_mask[frm] & self.castle_mask[to]
+        key ^= ZOBRIST_CASTLING[castling]
+
+        self.occupied = occ[0] | occ[1]
+        self.castling = castling
+        self.ep = ep
+        self.halfmove = halfmove
+        self.key = key
+        self.psq = psq
+        self.side = them
+        if us == BLACK:
+            self.fullmove += 1
+        if self.nnue is not None:
+            self.nnue.push(self, move, piece, captured)
+
+        if self.is_attacked(self.kings[us], them):
+            self.unmake(move)
+            return False
+        return True
+
+    def unmake(self, move: int):
+        packed = self.undo.pop()
+        self.key = self.keys.pop()
+        if self.nnue is not None:
+            self.nnue.pop()
+        captured = (packed & 15) - 1
+        self.castling = (packed >> 4) & 15
+        self.ep = ((packed >> 8) & 127) - 1
+        self.halfmove = (packed >> 15) & 1023
+        self.psq = (packed >> 25) - _UNDO_PSQ_OFFSET
+
+        them = self.side
+        us = them ^ 1
+        self.side = us
+        if us == BLACK:
+            self.fullmove -= 1
+
+        frm = move & 63
+        to = (move >> 6) & 63
+        flag = move >> 15
+        bb = self.bb
+        occ = self.occ
+        mailbox = self.mailbox
+
+        if flag == MOVE_CASTLE:
+            king = 6 * us + 5
+            rook = king - 2
+            base = 56 * us
+            if to > frm:
+                king_to, rook_to = base + 6, base + 5
+            else:
+                king_to, rook_to = base + 2, base + 3
+            bb[king] ^= 1 << king_to
+            bb[rook] ^= 1 << rook_to
+            occ[us] ^= (1 << king_to) | (1 << rook_to)
+            mailbox[king_to] = -1
+            mailbox[rook_to] = -1
+            bb[king] |= 1 << frm
+            bb[rook] |= 1 << to
+            occ[us] |= (1 << frm) | (1 << to)
+            mailbox[frm] = king
+            mailbox[to] = rook
+            self.kings[us] = frm
+        else:
+            from_bit = 1 << frm
+            to_bit = 1 << to
+            placed = mailbox[to]
+            piece = 6 * us if (move >> 12) & 7 else placed
+            bb[placed] ^= to_bit
+            bb[piece] |= from_bit
+            occ[us] ^= from_bit | to_bit
+            mailbox[to] = -1
+            mailbox[frm] = piece
+            if piece == 6 * us + 5:
+                self.kings[us] = frm
+            elif piece == 6 * us:
+                # пешечный ключ не хранится в стеке — откатываем теми же xor, что и в make
+                self.pawn_key ^= ZOBRIST_PIECE[piece * 64 + frm]
+                if placed == piece:
+                    self.pawn_key ^= ZOBRIST_PIECE[piece * 64 + to]
+            if captured >= 0:
+                cap_sq = to ^ 8 if flag == MOVE_EP else to
+                cap_bit = 1 << cap_sq
+                bb[captured] |= cap_bit
+                occ[them] |= cap_bit
+                mailbox[cap_sq] = captured
+                if captured == 6 * them:
+                    self.pawn_key ^= ZOBRIST_PIECE[captured * 64 + cap_sq]
+
+        self.occupied = occ[0] | occ[1]
+
+    def make_null(self):
+        """Пропуск хода для null-move pruning. Счётчик полуходов обнуляется, чтобы повторения не искались через null."""
+        self.undo.append(
+            (self.castling << 4)
+            | ((self.ep + 1) << 8)
+            | (self.halfmove << 15)
+            | ((self.psq + _UNDO_PSQ_OFFSET) << 25)
+        )
+        self.keys.append(self.key)
+        key = self.key ^ ZOBRIST_BLACK
+        if self.ep >= 0:
+            key ^= ZOBRIST_EP[self.ep & 7]
+            self.ep = -1
+        self.key = key
+        self.halfmove = 0
+        self.side ^= 1
+
+    def unmake_null(self):
+        packed = self.undo.pop()
+        self.key = self.keys.pop()
+        self.ep = ((packed >> 8) & 127) - 1
+        self.halfmove = (packed >> 15) & 1023
+        self.side ^= 1
+
+    def has_non_pawn_material(self, color: int) -> bool:
+        o = 6 * color
+        bb = self.bb
+        return bool(bb[o + 1] | bb[o + 2] | bb[o + 3] | bb[o + 4])
+
+    # ---- правила ----
+
+    def is_repetition(self) -> bool:
+        """Повтор позиции с той же стороной хода после последнего необратимого хода."""
+        keys = self.keys
+        key = self.key
+        stop = len(keys) - self.halfmove
+        stop = max(stop, 0)
+        i = len(keys) - 2
+        while i >= stop:
+            if keys[i] == key:
+                return True
+            i -= 2
+        return False
+
+    def is_insufficient_material(self) -> bool:
+        bb = self.bb
+        if bb[0] | bb[6] | bb[3] | bb[9] | bb[4] | bb[10]:
+            return False
+        return (bb[1] | bb[7] | bb[2] | bb[8]).bit_count() <= 1
+
+    def is_capture(self, move: int) -> bool:
+        flag = move >> 15
+        return flag == MOVE_EP or (flag != MOVE_CASTLE and self.mailbox[(move >> 6) & 63] >= 0)
+
+    # ---- граница UCI ----
+
+    def to_chess_move(self, move: int) -> chess.Move:
+        frm = move & 63
+        to = (move >> 6) & 63
+        if move >> 15 == MOVE_CASTLE and not self.chess960:
+            to = (frm & 56) | (6 if to > frm else 2)
+        return chess.Move(frm, to, ((move >> 12) & 7) or None)
+
+    def move_uci(self, move: int) -> str:
+        return self.to_chess_move(move).uci()
+
+    def to_board(self) -> chess.Board:
+        """chess.Board с той же расстановкой, без истории и прав на рокировку — для эндшпильных баз."""
+        bb = self.bb
+        board = chess.Board(None, chess960=self.chess960)
+        board.pawns = bb[0] | bb[6]
+        board.knights = bb[1] | bb[7]
+        board.bishops = bb[2] | bb[8]
+        board.rooks = bb[3] | bb[9]
+        board.queens = bb[4] | bb[10]
+        board.kings = bb[5] | bb[11]
+        board.occupied_co[chess.WHITE] = self.occ[WHITE]
+        board.occupied_co[chess.BLACK] = self.occ[BLACK]
+        board.occupied = self.occupied
+        board.turn = self.side == WHITE
+        board.ep_square = self.ep if self.ep >= 0 else None
+        board.halfmove_clock = self.halfmove
+        return board
+
+    def from_chess_move(self, move: chess.Move) -> int:
+        """Переводит ход python-chess в ход этой доски (рокировка в любой нотации)."""
+        for candidate in self.pseudo_legal_moves():
+            if candidate & 63 != move.from_square:
+                continue
+            if self.to_chess_move(candidate) == move:
+                return candidate
+            if candidate >> 15 == MOVE_CASTLE and (candidate >> 6) & 63 == move.to_square:
+                return candidate
+        raise ValueError(f"illegal move {move.uci()}")
+
+
+def _span(a: int, b: int) -> int:
+    """Все поля горизонтали между a и b включительно."""
+    lo, hi = (a, b) if a <= b else (b, a)
+    return (1 << (hi + 1)) - (1 << lo)
+
+# ---- Таблица транспозиций ----
+
+# Раскладка упакованного слова данных:
+#   биты  0-16  ход, 17-18 флаг, 19-26 глубина, 27-32 возраст, 33-63 оценка (со смещением)
+_TT_SCORE_OFFSET = 1 << 30
+_TT_BUCKET_WORDS = 4  # [key0, data0, key1, data1]
+_TT_BUCKET_BYTES = _TT_BUCKET_WORDS * 8
+HASHFULL_SAMPLE = 500
+# clear() обнуляет таблицу кусками такого размера, не создавая нулевой буфер во всю таблицу
+_TT_CLEAR_CHUNK = 1 << 20
+
+
+class TranspositionTable:
+    """
+    Таблица фиксированного размера на непрерывном буфере 64-битных слов.
+    Каждая корзина содержит два слота: слот 0 заменяется по глубине (или если запись
+    устарела по возрасту), слот 1 — всегда.
+    В слоте хранится (key ^ data, data): запись, порванная параллельной записью
+    другого процесса, просто не совпадёт по ключу — блокировки не нужны.
+    При shared=True буфер лежит в multiprocessing.shared_memory (Lazy SMP).
+    """
+
+    def __init__(self, size_mb: int = DEFAULT_HASH_MB, shared: bool = False):
+        self.age = 0
+        self.shared = shared
+        self.shm = None
+        self.raw = None
+        self.data = None
+        self.resize(size_mb)
+
+    @classmethod
+    def attach(cls, shm_name: str, buckets: int) -> TranspositionTable:
+        """Подключение вспомогательного процесса к общей таблице главного."""
+        tt = cls.__new__(cls)
+        tt.age = 0
+        tt.shared = True
+        tt.buckets = buckets
+        tt.mask = buckets - 1
+        tt.size_mb = (buckets * _TT_BUCKET_BYTES) >> 20
+        # помощники — дочерние процессы multiprocessing и делят resource_tracker с главным,
+        # поэтому повторная регистрация сегмента безвредна; удаляет его только владелец
+        from multiprocessing import shared_memory  # noqa: PLC0415 — ленивый импорт: нужен только при Threads > 1
+
+        tt.shm = shared_memory.SharedMemory(name=shm_name)
+        tt.owner = False
+        tt.raw = tt.shm.buf
+        tt.data = tt.raw.cast("Q")
+        return tt
+
+    def resize(self, size_mb: int):
+        size_mb = max(1, min(MAX_HASH_MB, int(size_mb)))
+        buckets = (size_mb * 1024 * 1024) // _TT_BUCKET_BYTES
+        # округляем вниз до степени двойки, чтобы индекс брать маской
+        self.buckets = 1 << (buckets.bit_length() - 1)
+        self.mask = self.buckets - 1
+        self.size_mb = size_mb
+        self.release()
+        nbytes = self.buckets * _TT_BUCKET_BYTES
+        if self.shared:
+            from multiprocessing import shared_memory  # noqa: PLC0415 — ленивый импорт: нужен только при Threads > 1
+
+            # новый сегмент уже заполнен нулями
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.owner = True
+            self.raw = self.shm.buf
+        else:
+            self.raw = memoryview(bytearray(nbytes))
+        self.data = self.raw.cast("Q")
+        self.age = 0
+
+    def release(self):
+        if self.data is not None:
+            self.data.release()
+            self.data = None
+        if self.shm is not None:
+            self.raw = None
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+            self.shm = None
+        self.raw = None
+
+    @property
+    def shm_name(self):
+        return self.shm.name if self.shm is not None else None
+
+    def clear(self):
+        raw = self.raw
+        size = len(raw)
+        zeros = bytes(min(_TT_CLEAR_CHUNK, size))
+        for start in range(0, size, len(zeros)):
+            end = min(start + len(zeros), size)
+            raw[start:end] = zeros[:end - start]
+        self.age = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 63
+
+    def hashfull(self) -> int:
+        """Заполненность в промилле: доля слотов текущего поколения в первых HASHFULL_SAMPLE корзинах."""
+        data = self.data
+        age = self.age
+        sample = min(self.buckets, HASHFULL_SAMPLE)
+        used = 0
+        for idx in range(0, sample * _TT_BUCKET_WORDS, _TT_BUCKET_WORDS):
+            for word in (data[idx + 1], data[idx + 3]):
+                if word and ((word >> 27) & 63) == age:
+                    used += 1
+        return used * 1000 // (sample * 2)
+
+    def probe(self, key: int):
+        data = self.data
+        idx = (key & self.mask) * _TT_BUCKET_WORDS
+        word = data[idx + 1]
+        if data[idx] ^ word != key:
+            word = data[idx + 3]
+            if data[idx + 2] ^ word != key:
+                return None
+        return TTEntry(
+            depth=(word >> 19) & 0xFF,
+            flag=(word >> 17) & 3,
+            score=(word >> 33) - _TT_SCORE_OFFSET,
+            best_move=word & 0x1FFFF,
+        )
+
+    def store(self, key: int, depth: int, flag: int, score: int, best_move: int):
+        data = self.data
+        idx = (key & self.mask) * _TT_BUCKET_WORDS
+        word = (
+            best_move
+            | (flag << 17)
+            | (max(0, min(depth, 255)) << 19)
+            | (self.age << 27)
+            | ((score + _TT_SCORE_OFFSET) << 33)
+        )
+        old_word = data[idx + 1]
+        old_key = data[idx] ^ old_word
+        if (
+            old_key == key
+            or old_word == 0
+            or ((old_word >> 27) & 63) != self.age
+            or depth >= ((old_word >> 19) & 0xFF)
+        ):
+            # не затираем известный лучший ход пустым
+            if old_key == key and not best_move:
+                word |= old_word & 0x1FFFF
+            data[idx] = key ^ word
+            data[idx + 1] = word
+        else:
+            data[idx + 2] = key ^ word
+            data[idx + 3] = word
 
 # ---- Утилиты ----
 
-def fast_board_key(board: chess.Board):
-    return (board.board_fen(), board.turn, board.castling_xfen(), board.ep_square, board.halfmove_clock)
+# стоимость фигуры по индексу 0-11
+PIECE_INDEX_VALUES = [PIECE_VALUES[i % 6 + 1] for i in range(12)]
 
 
-def mvv_lva_score(board, move):
+def mvv_lva_score(pos: Position, move: int):
     """
     MVV-LVA с учётом en-passant (если применимо) и премией за промоцию.
     Чем выше — тем раньше ход.
     """
     score = 0
-    if board.is_capture(move):
-        # определить жертву: для en-passant жертва — пешка не на to_square
-        if board.is_en_passant(move):
-            victim_value = PIECE_VALUES[chess.PAWN]
-        else:
-            victim = board.piece_at(move.to_square)
-            victim_value = PIECE_VALUES.get(victim.piece_type, 0) if victim else 0
-        attacker = board.piece_at(move.from_square)
-        attacker_value = PIECE_VALUES.get(attacker.piece_type, 0) if attacker else 0
-        score += victim_value * 10 - attacker_value
-    if move.promotion:
+    flag = move >> 15
+    if flag == MOVE_EP:
+        score += PIECE_VALUES[PAWN] * 10 - PIECE_VALUES[PAWN]
+    elif flag != MOVE_CASTLE:
+        victim = pos.mailbox[(move >> 6) & 63]
+        if victim >= 0:
+            score += PIECE_INDEX_VALUES[victim] * 10 - PIECE_INDEX_VALUES[pos.mailbox[move & 63]]
+    if (move >> 12) & 7:
         # повышение предпочтения для промоции
-        score += PIECE_VALUES[chess.QUEEN] // 2
+        score += PIECE_VALUES[QUEEN] // 2
     return score
 
 # ---- Оценка позиции ----
 
-def evaluate(board: chess.Board):
+def mg_eg(mg: int, eg: int) -> int:
+    """Пара оценок (миттельшпиль, эндшпиль) в одном int: складываются и вычитаются как обычные числа."""
+    return mg + (eg << 16)
+
+
+def split_mg_eg(packed: int):
+    mg = ((packed + 0x8000) & 0xFFFF) - 0x8000
+    return mg, (packed - mg) >> 16
+
+
+# Материал + PST одним плоским массивом: индекс (piece_index * 64 + square),
+# значения mg_eg() со стороны белых (чёрные фигуры — с минусом).
+PSQ_TABLE = [0] * (12 * 64)
+for _pt in PIECE_TYPES:
+    for _sq in range(64):
+        _mirror = _sq ^ 56
+        PSQ_TABLE[piece_index(WHITE, _pt) * 64 + _sq] = mg_eg(
+            MG_VALUES[_pt] + PST_MG[_pt][_sq], EG_VALUES[_pt] + PST_EG[_pt][_sq]
+        )
+        PSQ_TABLE[piece_index(BLACK, _pt) * 64 + _sq] = -mg_eg(
+            MG_VALUES[_pt] + PST_MG[_pt][_mirror], EG_VALUES[_pt] + PST_EG[_pt][_mirror]
+        )
+
+# фаза партии: 24 — все фигуры на доске, 0 — остались короли и пешки
+PHASE_WEIGHTS = (0, 1, 1, 2, 4, 0)
+MAX_PHASE = 24
+
+# ---- Пешечная структура ----
+
+BB_FILES = [BB_FILE_A << f for f in range(8)]
+BB_ADJACENT_FILES = [(BB_FILES[f - 1] if f > 0 else 0) | (BB_FILES[f + 1] if f < 7 else 0) for f in range(8)]
+
+
+def _forward_ranks(color: int, sq: int) -> int:
+    """Все горизонтали впереди поля с точки зрения стороны color."""
+    rank = sq >> 3
+    if color == WHITE:
+        return ~((1 << (8 * (rank + 1))) - 1) & 0xFFFFFFFFFFFFFFFF
+    return (1 << (8 * rank)) - 1
+
+
+# FORWARD_FILE — поля впереди на той же вертикали; ATTACK_SPAN — впереди на соседних
+# (откуда вражеская пешка ещё может прийти бить); PASSED_SPAN — их объединение.
+FORWARD_FILE = [[_forward_ranks(c, sq) & BB_FILES[sq & 7] for sq in range(64)] for c in (WHITE, BLACK)]
+ATTACK_SPAN = [[_forward_ranks(c, sq) & BB_ADJACENT_FILES[sq & 7] for sq in range(64)] for c in (WHITE, BLACK)]
+PASSED_SPAN = [[FORWARD_FILE[c][sq] | ATTACK_SPAN[c][sq] for sq in range(64)] for c in (WHITE, BLACK)]
+# форпосты ищем на 4-6 горизонталях своей стороны
+OUTPOST_RANKS = [0xFFFFFF << 24, 0xFFFFFF << 16]
+
+# бонус проходной по горизонтали со стороны её владельца
+PASSED_BONUS = [
+    mg_eg(0, 0), mg_eg(5, 10), mg_eg(10, 17), mg_eg(15, 25),
+    mg_eg(30, 45), mg_eg(55, 85), mg_eg(90, 130), mg_eg(0, 0),
+]
+ISOLATED_PENALTY = mg_eg(-10, -15)
+DOUBLED_PENALTY = mg_eg(-10, -25)
+KNIGHT_OUTPOST_BONUS = mg_eg(30, 20)
+BISHOP_OUTPOST_BONUS = mg_eg(15, 10)
+ROOK_OPEN_FILE_BONUS = mg_eg(40, 20)
+ROOK_SEMI_OPEN_FILE_BONUS = mg_eg(20, 10)
+
+PAWN_HASH_SIZE = 1 << 14
+# outposts и semi_open — пары битбордов по цветам: поля-форпосты и вертикали без своих пешек
+PawnEntry = namedtuple("PawnEntry", ["key", "score", "outposts", "semi_open"])
+_pawn_hash = [None] * PAWN_HASH_SIZE
+
+
+def evaluate_pawns(pos: Position) -> PawnEntry:
+    """Оценка пешечной структуры; зависит только от пешек, поэтому кэшируется по pos.pawn_key."""
+    key = pos.pawn_key
+    idx = key & (PAWN_HASH_SIZE - 1)
+    entry = _pawn_hash[idx]
+    if entry is not None and entry.key == key:
+        return entry
+
+    pawns = (pos.bb[0], pos.bb[6])
+    score = 0
+    outposts = [0, 0]
+    semi_open = [0, 0]
+    for color, sign in ((WHITE, 1), (BLACK, -1)):
+        own = pawns[color]
+        enemy = pawns[color ^ 1]
+        rest = own
+        while rest:
+            lsb = rest & -rest
+            rest ^= lsb
+            sq = lsb.bit_length() - 1
+            if not own & BB_ADJACENT_FILES[sq & 7]:
+                score += sign * ISOLATED_PENALTY
+            if own & FORWARD_FILE[color][sq]:
+                score += sign * DOUBLED_PENALTY
+            elif not enemy & PASSED_SPAN[color][sq]:
+                rank = sq >> 3 if color == WHITE else 7 - (sq >> 3)
+                score += sign * PASSED_BONUS[rank]
+        for f in range(8):
+            if not own & BB_FILES[f]:
+                semi_open[color] |= BB_FILES[f]
+        # форпост: поле под защитой своей пешки, которое вражеские пешки уже не атакуют
+        candidates = OUTPOST_RANKS[color]
+        while candidates:
+            lsb = candidates & -candidates
+            candidates ^= lsb
+            sq = lsb.bit_length() - 1
+            if PAWN_ATTACKS[color ^ 1][sq] & own and not ATTACK_SPAN[color][sq] & enemy:
+                outposts[color] |= lsb
+
+    entry = PawnEntry(key, score, tuple(outposts), tuple(semi_open))
+    _pawn_hash[idx] = entry
+    return entry
+
+
+MOBILITY_WEIGHT = {
+    KNIGHT: 4,
+    BISHOP: 5,
+    ROOK: 3,
+    QUEEN: 2,
+}
 
-    if board.is_checkmate():
-        return -INF + 1
-    if board.is_stalemate() or board.is_insufficient_material():
-        return 0
 
-    material = 0
-    pst_score = 0
 
-    for piece_type in PIECE_VALUES:
-        for sq in board.pieces(piece_type, chess.WHITE):
-            material += PIECE_VALUES[piece_type]
-            if piece_type in PST:
-                pst_score += PST[piece_type][sq]
-        for sq in board.pieces(piece_type, chess.BLACK):
-            material -= PIECE_VALUES[piece_type]
-            if piece_type in PST:
-                pst_score -= PST[piece_type][chess.square_mirror(sq)]
+def _squares_bb(*names) -> int:
+    """Битборд по именам полей: _squares_bb("c4", "b5")."""
+    bb = 0
+    for name in names:
+        bb |= 1 << (ord(name[0]) - ord("a") + 8 * (int(name[1]) - 1))
+    return bb
+
+
+DEV_SQUARES_WHITE = _squares_bb("c4", "b5", "e3", "f4", "g5")
+DEV_SQUARES_BLACK = _squares_bb("c5", "b4", "e6", "f5", "g4")
+
+
+def side_mobility(pos: Position, color: int) -> int:
+    """Взвешенное число полей, атакуемых лёгкими и тяжёлыми фигурами стороны (без своих фигур)."""
+    bb = pos.bb
+    o = 6 * color
+    not_own = ~pos.occ[color]
+    occupied = pos.occupied
+    mobility = 0
+    knights = bb[o + 1]
+    while knights:
+        lsb = knights & -knights
+        knights ^= lsb
+        mobility += (KNIGHT_ATTACKS[lsb.bit_length() - 1] & not_own).bit_count() * MOBILITY_WEIGHT[KNIGHT]
+    for piece, weight, diagonal, straight in (
+        (o + 2, MOBILITY_WEIGHT[BISHOP], True, False),
+        (o + 3, MOBILITY_WEIGHT[ROOK], False, True),
+        (o + 4, MOBILITY_WEIGHT[QUEEN], True, True),
+    ):
+        pieces = bb[piece]
+        while pieces:
+            lsb = pieces & -pieces
+            pieces ^= lsb
+            sq = lsb.bit_length() - 1
+            attacks = 0
+            if diagonal:
+                attacks |= DIAG_ATTACKS[sq][occupied & DIAG_MASKS[sq]]
+            if straight:
+                attacks |= RANK_ATTACKS[sq][occupied & RANK_MASKS[sq]] | FILE_ATTACKS[sq][occupied & FILE_MASKS[sq]]
+            mobility += (attacks & not_own).bit_count() * weight
+    return mobility
+
+
+# Кэш статической оценки: слот — один int, (старшие биты ключа << 32) | (оценка + EVAL_SCORE_OFFSET).
+# Младшие EVAL_CACHE_BITS ключа — индекс слота, поэтому в записи не хранятся.
+EVAL_CACHE_BITS = 16
+EVAL_CACHE_MASK = (1 << EVAL_CACHE_BITS) - 1
+EVAL_SCORE_OFFSET = 1 << 31
+# ферзь в первые EARLY_QUEEN_MOVES ходов партии — штраф (только в ручной оценке)
+EARLY_QUEEN_MOVES = 8
+EARLY_QUEEN_PENALTY = 20
+_eval_cache = [-1] * (1 << EVAL_CACHE_BITS)
+
+
+def clear_eval_cache():
+    _eval_cache[:] = [-1] * len(_eval_cache)
+
+
+def evaluate(pos: Position):
+    """
+    Статическая оценка со стороны хода: сеть из EvalFile, если она загружена, иначе ручная.
+    Мат, пат и ничьи здесь не распознаются — это дело поиска, у которого уже есть список ходов.
+    """
+    key = pos.key
+    idx = key & EVAL_CACHE_MASK
+    entry = _eval_cache[idx]
+    if entry >> 32 == key >> EVAL_CACHE_BITS:
+        score = (entry & 0xFFFFFFFF) - EVAL_SCORE_OFFSET
+    else:
+        score = pos.nnue.evaluate(pos.side) if pos.nnue is not None else evaluate_classical(pos)
+        _eval_cache[idx] = ((key >> EVAL_CACHE_BITS) << 32) | (score + EVAL_SCORE_OFFSET)
+
+    # номер хода не входит в Zobrist-ключ, поэтому зависящий от него член считается мимо кэша
+    if pos.nnue is None and pos.fullmove < EARLY_QUEEN_MOVES:
+        bb = pos.bb
+        early_queen = (bb[10].bit_count() - bb[4].bit_count()) * EARLY_QUEEN_PENALTY
+        score += early_queen if pos.side == WHITE else -early_queen
+    return score
 
-    # mobility: безопасный подсчёт
-    mobility_count = sum(1 for _ in board.legal_moves)
-    mobility = 10 * mobility_count
 
-    check_bonus = -50 if board.is_check() else 0
+def evaluate_classical(pos: Position):
+    bb = pos.bb
+    # материал и PST поддерживаются инкрементально в Position.make/unmake
+    packed = pos.psq
+    pawns = evaluate_pawns(pos)
+    packed += pawns.score
+    for color, sign in ((WHITE, 1), (BLACK, -1)):
+        o = 6 * color
+        outposts = pawns.outposts[color]
+        packed += sign * (
+            (bb[o + 1] & outposts).bit_count() * KNIGHT_OUTPOST_BONUS
+            + (bb[o + 2] & outposts).bit_count() * BISHOP_OUTPOST_BONUS
+        )
+        semi_open = pawns.semi_open[color]
+        open_files = semi_open & pawns.semi_open[color ^ 1]
+        packed += sign * (
+            (bb[o + 3] & open_files).bit_count() * ROOK_OPEN_FILE_BONUS
+            + (bb[o + 3] & semi_open & ~open_files).bit_count() * ROOK_SEMI_OPEN_FILE_BONUS
+        )
+
+    # плавный переход от миттельшпиля к эндшпилю по оставшимся фигурам
+    phase = 0
+    for pt in (KNIGHT, BISHOP, ROOK, QUEEN):
+        phase += (bb[pt - 1] | bb[pt + 5]).bit_count() * PHASE_WEIGHTS[pt - 1]
+    phase = min(phase, MAX_PHASE)
+    mg, eg = split_mg_eg(packed)
+    blended = mg * phase + eg * (MAX_PHASE - phase)
+    # округление к нулю, чтобы оценка не зависела от того, за кого играют белые
+    score = blended // MAX_PHASE if blended >= 0 else -(-blended // MAX_PHASE)
+
+    score += side_mobility(pos, WHITE) - side_mobility(pos, BLACK)
 
     # ========= BISHOP =========
-    for sq in board.pieces(chess.BISHOP, chess.WHITE):
-        blocked = 0
-        for pawn_sq in board.pieces(chess.PAWN, chess.WHITE):
-            if chess.square_color(sq) == chess.square_color(pawn_sq):
-                blocked += 1
-        score -= blocked * 4
+    # свои пешки на полях цвета слона мешают ему
+    for color, sign in ((WHITE, -1), (BLACK, 1)):
+        bishops = bb[6 * color + 2]
+        pawns = bb[6 * color]
+        while bishops:
+            lsb = bishops & -bishops
+            bishops ^= lsb
+            same_color = BB_LIGHT_SQUARES if lsb & BB_LIGHT_SQUARES else BB_DARK_SQUARES
+            score += sign * (pawns & same_color).bit_count() * 4
+
+    score += (bb[2] & DEV_SQUARES_WHITE).bit_count() * 15
+    score -= (bb[8] & DEV_SQUARES_BLACK).bit_count() * 15
+
+    score = score if pos.side == WHITE else -score
+    if pos.in_check():
+        score -= 50
+    return score
 
-    for sq in board.pieces(chess.BISHOP, chess.BLACK):
-        blocked = 0
-        for pawn_sq in board.pieces(chess.PAWN, chess.BLACK):
-            if chess.square_color(sq) == chess.square_color(pawn_sq):
-                blocked += 1
-        score += blocked * 4
+# ---- NNUE ----
+# Необязательная нейросетевая оценка (EvalFile). NumPy импортируется только при загрузке сети.
 
+NNUE_FEATURES = 12 * 64
+NNUE_QA = 255
+NNUE_QB = 64
+NNUE_SCALE = 400
 
-    DEV_SQUARES_WHITE = {chess.C4, chess.B5, chess.E3, chess.F4, chess.G5}
-    DEV_SQUARES_BLACK = {chess.C5, chess.B4, chess.E6, chess.F5, chess.G4}
 
-    for sq in board.pieces(chess.BISHOP, chess.WHITE):
-        if sq in DEV_SQUARES_WHITE:
-            score += 15
+class Network:
+    """
+    Сеть HalfKA-типа: (перспектива, поле своего короля) x фигура x поле -> скрытый слой H,
+    затем clipped ReLU по обеим перспективам (своя первой) и один выход.
+    Файл — .npz с массивами ft_weight (F x H, int16), ft_bias (H, int16),
+    out_weight (2H, int16), out_bias (int32); необязательно qa, qb, scale.
+    F = 768 — без корзин по королю, 64 * 768 — отдельный набор весов на каждое поле короля.
+    Фигуры в признаках считаются от перспективы: 0-5 свои, 6-11 чужие, доска отражается для чёрных.
+    """
 
-    for sq in board.pieces(chess.BISHOP, chess.BLACK):
-        if sq in DEV_SQUARES_BLACK:
-            score -= 15
+    def __init__(self, np, weights):
+        self.np = np
+        self.ft_weight = np.ascontiguousarray(weights["ft_weight"], dtype=np.int16)
+        self.ft_bias = np.asarray(weights["ft_bias"], dtype=np.int16)
+        self.out_weight = np.asarray(weights["out_weight"], dtype=np.int32)
+        self.out_bias = int(weights["out_bias"])
+        self.qa = int(weights["qa"]) if "qa" in weights else NNUE_QA
+        self.qb = int(weights["qb"]) if "qb" in weights else NNUE_QB
+        self.scale = int(weights["scale"]) if "scale" in weights else NNUE_SCALE
+        features, hidden = self.ft_weight.shape
+        if features not in (NNUE_FEATURES, 64 * NNUE_FEATURES):
+            raise ValueError(f"unsupported feature count {features}")
+        if self.ft_bias.shape != (hidden,) or self.out_weight.shape != (2 * hidden,):
+            raise ValueError("layer sizes do not match")
+        self.king_buckets = features > NNUE_FEATURES
+
+    def feature(self, perspective: int, piece: int, sq: int, king_sq: int) -> int:
+        if perspective == BLACK:
+            piece = (piece + 6) % 12
+            sq ^= 56
+            king_sq ^= 56
+        index = piece * 64 + sq
+        return index + king_sq * NNUE_FEATURES if self.king_buckets else index
+
+    def refresh(self, pos: Position, perspective: int):
+        """Аккумулятор перспективы с нуля: смещение + строки всех фигур на доске."""
+        king_sq = pos.kings[perspective]
+        features = [
+            self.feature(perspective, piece, sq, king_sq) for sq, piece in enumerate(pos.mailbox) if piece >= 0
+        ]
+        return self.ft_bias + self.ft_weight[features].sum(axis=0, dtype=self.np.int16)
+
+    def output(self, us, them) -> int:
+        np = self.np
+        hidden = np.concatenate((us, them))
+        np.clip(hidden, 0, self.qa, out=hidden)
+        value = int(np.dot(hidden.astype(np.int32), self.out_weight)) + self.out_bias
+        return value * self.scale // (self.qa * self.qb)
+
+
+class NnueAccumulator:
+    """
+    Стек аккумуляторов первого слоя, параллельный стеку ходов Position: make кладёт
+    пару [белые, чёрные], пересчитанную по изменившимся фигурам, unmake снимает.
+    """
 
-    if board.fullmove_number < 8:
-        for sq in board.pieces(chess.QUEEN, chess.WHITE):
-            score -= 20
-        for sq in board.pieces(chess.QUEEN, chess.BLACK):
-            score += 20
+    def __init__(self, network: Network, pos: Position):
+        self.network = network
+        self.stack = [(network.refresh(pos, WHITE), network.refresh(pos, BLACK))]
+
+    def push(self, pos: Position, move: int, piece: int, captured: int):
+        """Вызывается из make() после того, как фигуры уже переставлены."""
+        net = self.network
+        frm = move & 63
+        to = (move >> 6) & 63
+        us = piece // 6
+        if move >> 15 == MOVE_CASTLE:
+            rook = piece - 2
+            removed = [(piece, frm), (rook, to)]
+            added = [(piece, pos.kings[us]), (rook, pos.kings[us] + (1 if to < frm else -1))]
+        else:
+            removed = [(piece, frm)]
+            if captured >= 0:
+                removed.append((captured, to ^ 8 if move >> 15 == MOVE_EP else to))
+            added = [(pos.mailbox[to], to)]
+
+        accumulators = []
+        for perspective, parent in zip((WHITE, BLACK), self.stack[-1], strict=True):
+            king_sq = pos.kings[perspective]
+            if net.king_buckets and piece % 6 == 5 and perspective == us:
+                # король сменил корзину — перспективу проще пересчитать целиком
+                accumulators.append(net.refresh(pos, perspective))
+                continue
+            acc = parent.copy()
+            for p, sq in removed:
+                acc -= net.ft_weight[net.feature(perspective, p, sq, king_sq)]
+            for p, sq in added:
+                acc += net.ft_weight[net.feature(perspective, p, sq, king_sq)]
+            accumulators.append(acc)
+        self.stack.append(tuple(accumulators))
+
+    def pop(self):
+        self.stack.pop()
+
+    def evaluate(self, side: int) -> int:
+        white, black = self.stack[-1]
+        if side == WHITE:
+            return self.network.output(white, black)
+        return self.network.output(black, white)
+
+
+@functools.lru_cache(maxsize=4)
+def load_network(path: str):
+    """Сеть из EvalFile; при ошибке (в том числе без NumPy) — None и ручная оценка."""
+    try:
+        import numpy as np  # noqa: PLC0415 — NumPy необязателен и нужен только для EvalFile
+    except ImportError:
+        print("EvalFile: NumPy is not installed, using classical evaluation", file=sys.stderr)
+        sys.stderr.flush()
+        return None
+    try:
+        with np.load(path) as weights:
+            return Network(np, {name: weights[name] for name in weights.files})
+    except (OSError, ValueError, KeyError) as e:
+        print(f"EvalFile: cannot load {path}: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        return None
 
+# ---- TT и state ----
+MAX_PLY = 128
+# оценки по модулю выше — мат
+MATE_BOUND = INF - 1000
+# выигрыш по эндшпильным базам: ниже любого мата, но выше любой оценки позиции
+TB_WIN = MATE_BOUND - 1 - MAX_PLY
+TB_BOUND = TB_WIN - MAX_PLY
+# так выигрыш по базам выглядит в info (cp за вычетом расстояния до корня)
+TB_WIN_CP = 20000
+# глубина, с которой результат зондирования кладётся в TT
+TB_DEPTH_BONUS = 6
+
+
+# Мат оценивается как INF - (число полуходов от корня), выигрыш по базам — как TB_WIN - ply.
+# В TT храним расстояние от самой позиции, иначе оценка, найденная на одном ply, исказится на другом.
+def score_to_tt(score: int, ply: int) -> int:
+    if score >= TB_BOUND:
+        return score + ply
+    if score <= -TB_BOUND:
+        return score - ply
+    return score
 
-    score_white = material + pst_score + mobility + check_bonus
-    return score_white if board.turn == chess.WHITE else -score_white
 
-# ---- TT и state ----
-class SearchState:
+def score_from_tt(score: int, ply: int) -> int:
+    if score >= TB_BOUND:
+        return score - ply
+    if score <= -TB_BOUND:
+        return score + ply
+    return score
+
+
+def uci_score(score: int) -> str:
+    """Оценка для info: cp или mate в ходах (отрицательное — нам ставят мат)."""
+    if score >= MATE_BOUND:
+        return f"mate {(INF - score + 1) // 2}"
+    if score <= -MATE_BOUND:
+        return f"mate -{(INF + score) // 2}"
+    if score >= TB_BOUND:
+        return f"cp {TB_WIN_CP - (TB_WIN - score)}"
+    if score <= -TB_BOUND:
+        return f"cp {-TB_WIN_CP + (TB_WIN + score)}"
+    return f"cp {score}"
+
+
+# единственные открытые базы Syzygy процесса: [SyzygyPath, Tablebase]
+_open_tablebase = [None, None]
+
+
+def open_tablebase(path: str):
+    """
+    Открытые базы Syzygy по строке SyzygyPath (каталоги через os.pathsep). Держим открытыми
+    одни базы: повторный go их не перечитывает, а смена SyzygyPath закрывает прежние файлы.
+    """
+    if _open_tablebase[0] == path:
+        return _open_tablebase[1]
+    if _open_tablebase[1] is not None:
+        _open_tablebase[1].close()
+        _open_tablebase[:] = [None, None]
+
+    import chess.syzygy  # noqa: PLC0415 — ленивый импорт: базы нужны только с SyzygyPath
+
+    tablebase = chess.syzygy.Tablebase()
+    for directory in path.split(os.pathsep):
+        if not directory:
+            continue
+        try:
+            tablebase.add_directory(directory)
+        except OSError as e:
+            print(f"Syzygy: cannot open {directory}: {e}", file=sys.stderr)
+            sys.stderr.flush()
+    _open_tablebase[:] = [path, tablebase]
+    return tablebase
+
+
+ASPIRATION_MIN_DEPTH = 4
+ASPIRATION_DELTA = 25
+HISTORY_MAX = 16384
+# как часто (в узлах) поиск смотрит на часы и флаг остановки
+POLL_INTERVAL = 256
+# индекс «фигура+поле назначения» для countermove и continuation history: piece * 64 + to
+PIECE_TO_SIZE = 12 * 64
+
+RFP_MAX_DEPTH = 6
+# запас delta pruning в quiescence поверх стоимости взятой фигуры
+QS_DELTA_MARGIN = 200
+RAZOR_MAX_DEPTH = 3
+NULL_MIN_DEPTH = 3
+FUTILITY_MAX_DEPTH = 6
+LMP_MAX_DEPTH = 8
+LMR_MIN_DEPTH = 3
+LMR_TABLE_SIZE = 64
+
+
+# UCI-имя -> (атрибут, тип, по умолчанию, мин, макс)
+SEARCH_OPTIONS = {
+    "NullMove": ("null_move", "check", True, None, None),
+    "NullMoveReduction": ("null_move_reduction", "spin", 3, 1, 6),
+    "LMR": ("lmr", "check", True, None, None),
+    "LMRBase": ("lmr_base", "spin", 75, 0, 300),
+    "LMRDivisor": ("lmr_divisor", "spin", 225, 100, 600),
+    "ReverseFutility": ("reverse_futility", "check", True, None, None),
+    "ReverseFutilityMargin": ("reverse_futility_margin", "spin", 80, 0, 500),
+    "Futility": ("futility", "check", True, None, None),
+    "FutilityMargin": ("futility_margin", "spin", 100, 0, 500),
+    "Razoring": ("razoring", "check", True, None, None),
+    "RazorMargin": ("razor_margin", "spin", 250, 0, 1000),
+    "LateMovePruning": ("late_move_pruning", "check", True, None, None),
+    "LMPBase": ("lmp_base", "spin", 3, 0, 20),
+    "SyzygyPath": ("syzygy_path", "string", "", None, None),
+    "SyzygyProbeLimit": ("syzygy_probe_limit", "spin", 7, 0, 7),
+    "EvalFile": ("eval_file", "string", "", None, None),
+}
+
+
+class SearchParams:
+    """
+    Настройки поиска: выборочные отсечения (каждое — UCI-опция для A/B-тестов),
+    эндшпильные базы и файл сети. Объект передаётся помощникам SMP, поэтому хранит только простые значения.
+    """
+
     def __init__(self):
-        self.tt = {}
-        self.nodes = 0
-        self.start_time = 0.0
-        self.time_limit = 0.0
-        self.history = defaultdict(int)
+        for attr, _, default, _, _ in SEARCH_OPTIONS.values():
+            setattr(self, attr, default)
+        self.build_lmr_table()
+
+    def build_lmr_table(self):
+        """Редукция LMR = base + ln(depth) * ln(move_number) / divisor (в сотых долях)."""
+        base = self.lmr_base / 100
+        divisor = self.lmr_divisor / 100
+        self.lmr_table = [
+            [0 if d == 0 or m == 0 else int(base + math.log(d) * math.log(m) / divisor) for m in range(LMR_TABLE_SIZE)]
+            for d in range(LMR_TABLE_SIZE)
+        ]
+
+    @classmethod
+    def uci_lines(cls):
+        for name, (_, kind, default, lo, hi) in SEARCH_OPTIONS.items():
+            if kind == "check":
+                yield f"option name {name} type check default {'true' if default else 'false'}"
+            elif kind == "string":
+                yield f"option name {name} type string default {default or '<empty>'}"
+            else:
+                yield f"option name {name} type spin default {default} min {lo} max {hi}"
+
+    def set_option(self, name: str, value: str) -> bool:
+        """Возвращает True, если опция относится к поиску (даже при некорректном значении)."""
+        for option, (attr, kind, _, lo, hi) in SEARCH_OPTIONS.items():
+            if option.lower() != name.lower():
+                continue
+            if kind == "check":
+                setattr(self, attr, value.lower() == "true")
+            elif kind == "string":
+                setattr(self, attr, "" if value == "<empty>" else value)
+            else:
+                try:
+                    setattr(self, attr, max(lo, min(hi, int(value))))
+                except ValueError:
+                    return True
+                if attr in ("lmr_base", "lmr_divisor"):
+                    self.build_lmr_table()
+            return True
+        return False
 
-class SearchAbort(Exception):
-    pass
 
+# debug-режим: включается командой «debug on» или переменной окружения
+DEBUG_ENV = "DARKON_DEBUG"
+# время фазы меряется на каждом DEBUG_SAMPLE_INTERVAL-м вызове и экстраполируется на все
+DEBUG_SAMPLE_INTERVAL = 64
 
-def quiescence(board: chess.Board, alpha: int, beta: int, state: SearchState, stop_event: threading.Event):
-    if stop_event.is_set():
-        raise SearchAbort()
-    if state.start_time and (time.time() - state.start_time) > state.time_limit:
-        raise SearchAbort()
 
+class SearchStats:
+    """
+    Счётчики поиска для debug-режима. Без debug у SearchState.stats = None,
+    и поиск платит только за проверку на None.
+    """
+
+    PHASES = ("eval", "tt", "ordering", "qgen")
+
+    def __init__(self):
+        self.qnodes = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.calls = dict.fromkeys(self.PHASES, 0)
+        self.sampled = dict.fromkeys(self.PHASES, 0)
+        self.sampled_ns = dict.fromkeys(self.PHASES, 0)
+
+    def _sample(self, phase: str) -> bool:
+        calls = self.calls[phase] + 1
+        self.calls[phase] = calls
+        return calls % DEBUG_SAMPLE_INTERVAL == 0
+
+    def _record(self, phase: str, started_ns: int):
+        self.sampled[phase] += 1
+        self.sampled_ns[phase] += time.perf_counter_ns() - started_ns
+
+    def evaluate(self, pos: Position) -> int:
+        if not self._sample("eval"):
+            return evaluate(pos)
+        started = time.perf_counter_ns()
+        score = evaluate(pos)
+        self._record("eval", started)
+        return score
+
+    def probe(self, tt: TranspositionTable, key: int):
+        self.tt_probes += 1
+        if self._sample("tt"):
+            started = time.perf_counter_ns()
+            entry = tt.probe(key)
+            self._record("tt", started)
+        else:
+            entry = tt.probe(key)
+        if entry:
+            self.tt_hits += 1
+        return entry
+
+    def moves(self, moves):
+        """Обёртка над генератором pick_moves: время на выдачу каждого хода (генерация + сортировка)."""
+        if not self._sample("ordering"):
+            yield from moves
+            return
+        # один замер на узел: генератор могут бросить после отсечения, поэтому итог — в finally
+        spent = 0
+        started = time.perf_counter_ns()
+        try:
+            for move in moves:
+                spent += time.perf_counter_ns() - started
+                yield move
+                started = time.perf_counter_ns()
+            spent += time.perf_counter_ns() - started
+        finally:
+            self.sampled["ordering"] += 1
+            self.sampled_ns["ordering"] += spent
+
+    def captures(self, pos: Position) -> list:
+        """Взятия quiescence в порядке MVV-LVA."""
+        timed = self._sample("qgen")
+        started = time.perf_counter_ns() if timed else 0
+        captures = []
+        pos.gen_noisy(captures)
+        captures.sort(key=lambda mv: -mvv_lva_score(pos, mv))
+        if timed:
+            self._record("qgen", started)
+        return captures
+
+    def phase_ms(self, phase: str) -> int:
+        """Оценка полного времени фазы по выборке, мс."""
+        if not self.sampled[phase]:
+            return 0
+        return self.sampled_ns[phase] * self.calls[phase] // self.sampled[phase] // 1_000_000
+
+    def info_lines(self, nodes: int):
+        def pct(part, whole):
+            return f"{100 * part / whole:.1f}%" if whole else "n/a"
+
+        main_nodes = nodes - self.qnodes
+        yield f"info string debug nodes {nodes} main {main_nodes} qnodes {self.qnodes} ({pct(self.qnodes, nodes)})"
+        yield (
+            f"info string debug tt probes {self.tt_probes} hits {self.tt_hits} ({pct(self.tt_hits, self.tt_probes)}) "
+            f"cutoffs {self.tt_cutoffs} ({pct(self.tt_cutoffs, self.tt_probes)})"
+        )
+        yield (
+            f"info string debug beta cutoffs {self.cutoffs} "
+            f"first move {self.first_move_cutoffs} ({pct(self.first_move_cutoffs, self.cutoffs)})"
+        )
+        yield f"info string debug eval calls {self.calls['eval']}"
+        yield "info string debug time (ms, sampled 1/{}) {}".format(
+            DEBUG_SAMPLE_INTERVAL, " ".join(f"{phase} {self.phase_ms(phase)}" for phase in self.PHASES)
+        )
+
+
+class SearchState:
+    def __init__(self, tt: TranspositionTable = None, params: SearchParams = None):
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.params = params if params is not None else SearchParams()
+        self.nodes = 0
+        # часы поиска — time.perf_counter_ns(); deadline_ns — жёсткий лимит (0 — без лимита),
+        # мягкий ведёт time_manager главного потока
+        self.start_ns = 0
+        self.deadline_ns = 0
+        self.time_manager = None
+        # лимит узлов (0 — без лимита) и номер узла, на котором пора опросить часы и флаг остановки
+        self.node_limit = 0
+        self.next_check = 0
+        # наибольший ply, до которого дошёл поиск (включая quiescence), и попадания в эндшпильные базы
+        self.seldepth = 0
+        self.tbhits = 0
+        self.tablebase = None
+        self.network = None
+        # узлы, потраченные на каждый корневой ход за весь поиск
+        self.root_nodes = {}
+        # butterfly history: [side * 4096 + from * 64 + to]
+        self.history = [0] * (2 * 4096)
+        # countermove: [piece_to предыдущего хода] -> ход
+        self.countermoves = [0] * PIECE_TO_SIZE
+        # continuation history: [piece_to хода ply-1 или ply-2][piece_to текущего хода]
+        self.cont_history = [0] * (PIECE_TO_SIZE * PIECE_TO_SIZE)
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 2)]
+        # piece_to хода, сделанного на каждом ply (-1 — нет хода)
+        self.stack = [-1] * (MAX_PLY + 2)
+        # треугольная таблица PV: pv[ply][ply:pv_len[ply]] — лучшая линия из узла на этом ply
+        self.pv = [[0] * (MAX_PLY + 2) for _ in range(MAX_PLY + 2)]
+        self.pv_len = [0] * (MAX_PLY + 2)
+        # счётчики debug-режима на текущий поиск (None — debug выключен)
+        self.debug = bool(os.environ.get(DEBUG_ENV))
+        self.stats = None
+
+    def new_search(self):
+        """
+        Подготовка к очередному go. Таблица и история живут всю партию: переходим
+        к новому поколению TT, а killers и стек ходов привязаны к ply и сбрасываются.
+        """
+        self.nodes = 0
+        self.next_check = 0
+        self.seldepth = 0
+        self.tbhits = 0
+        self.root_nodes = {}
+        path = self.params.syzygy_path
+        self.tablebase = open_tablebase(path) if path and self.params.syzygy_probe_limit else None
+        network = load_network(self.params.eval_file) if self.params.eval_file else None
+        if network is not self.network:
+            # оценки прежней функции в кэше больше не годятся
+            clear_eval_cache()
+            self.network = network
+        self.tt.new_search()
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 2)]
+        self.stack = [-1] * (MAX_PLY + 2)
+        self.stats = SearchStats() if self.debug else None
+
+    def clear(self):
+        """ucinewgame: забываем всё, что выучили за партию."""
+        self.tt.clear()
+        clear_eval_cache()
+        self.history = [0] * (2 * 4096)
+        self.countermoves = [0] * PIECE_TO_SIZE
+        self.cont_history = [0] * (PIECE_TO_SIZE * PIECE_TO_SIZE)
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 2)]
+        self.stack = [-1] * (MAX_PLY + 2)
+
+    def elapsed(self) -> float:
+        return (time.perf_counter_ns() - self.start_ns) / 1e9
+
+    def out_of_time(self) -> bool:
+        return self.deadline_ns != 0 and time.perf_counter_ns() >= self.deadline_ns
+
+    def poll(self, stop_event):
+        """
+        Опрос остановки раз в POLL_INTERVAL узлов вместо каждого узла: флаг от UCI-потока,
+        лимит узлов (ровно node_limit узлов) и жёсткий лимит времени.
+        """
+        if self.node_limit and self.nodes >= self.node_limit:
+            raise SearchAbort()
+        if stop_event.is_set() or self.out_of_time():
+            raise SearchAbort()
+        self.next_check = self.nodes + POLL_INTERVAL
+        if self.node_limit and self.next_check > self.node_limit:
+            self.next_check = self.node_limit
+
+
+def update_stat(table: list, idx: int, bonus: int):
+    """Обновление с «гравитацией»: значения насыщаются у ±HISTORY_MAX."""
+    table[idx] += bonus - table[idx] * abs(bonus) // HISTORY_MAX
+
+
+def update_quiet_stats(pos: Position, state: SearchState, ply: int, move: int, quiets_tried: list, depth: int):
+    """Бета-отсечение тихим ходом: killers, countermove, history и continuation history."""
+    killers = state.killers[ply]
+    if killers[0] != move:
+        killers[1] = killers[0]
+        killers[0] = move
+    prev1 = state.stack[ply - 1] if ply >= 1 else -1
+    prev2 = state.stack[ply - 2] if ply >= 2 else -1
+    if prev1 >= 0:
+        state.countermoves[prev1] = move
+
+    bonus = min(depth * depth * 16, 1200)
+    side = pos.side * 4096
+    mailbox = pos.mailbox
+    history = state.history
+    cont = state.cont_history
+    for quiet in quiets_tried:
+        delta = bonus if quiet == move else -bonus
+        update_stat(history, side + (quiet & 4095), delta)
+        piece_to = mailbox[quiet & 63] * 64 + ((quiet >> 6) & 63)
+        if prev1 >= 0:
+            update_stat(cont, prev1 * PIECE_TO_SIZE + piece_to, delta)
+        if prev2 >= 0:
+            update_stat(cont, prev2 * PIECE_TO_SIZE + piece_to, delta)
+
+
+def pick_moves(pos: Position, state: SearchState, ply: int, tt_move: int):
+    """
+    Поэтапная выдача ходов: ход из TT, взятия, не проигрывающие по SEE (выбором максимума
+    MVV-LVA, без полной сортировки), killers и countermove, тихие ходы по истории и,
+    наконец, невыгодные взятия.
+    Тихие ходы генерируются, только если до них дошло дело.
+    """
+    if tt_move and pos.is_pseudo_legal(tt_move):
+        yield tt_move
+    else:
+        tt_move = 0
+
+    mailbox = pos.mailbox
+    noisy = []
+    pos.gen_noisy(noisy)
+    captures = [(mvv_lva_score(pos, move), move) for move in noisy if move != tt_move]
+    bad = []
+
+    # взятия выбираем по MVV-LVA; проигрывающие по SEE откладываем в самый конец
+    while captures:
+        best_idx = 0
+        for i in range(1, len(captures)):
+            if captures[i][0] > captures[best_idx][0]:
+                best_idx = i
+        move = captures[best_idx][1]
+        captures[best_idx] = captures[-1]
+        captures.pop()
+        victim = mailbox[(move >> 6) & 63]
+        if (
+            move >> 15 == MOVE_EP
+            or (victim >= 0 and PIECE_INDEX_VALUES[victim] >= PIECE_INDEX_VALUES[mailbox[move & 63]])
+            or pos.see_ge(move, 0)
+        ):
+            yield move
+        else:
+            bad.append(move)
+
+    killers = state.killers[ply]
+    prev1 = state.stack[ply - 1] if ply >= 1 else -1
+    counter = state.countermoves[prev1] if prev1 >= 0 else 0
+    refutations = []
+    for move in (killers[0], killers[1], counter):
+        if (
+            move
+            and move != tt_move
+            and move not in refutations
+            and not pos.is_capture(move)
+            and not (move >> 12) & 7
+            and pos.is_pseudo_legal(move)
+        ):
+            refutations.append(move)
+            yield move
+
+    quiets = []
+    pos.gen_quiet(quiets)
+    prev2 = state.stack[ply - 2] if ply >= 2 else -1
+    side = pos.side * 4096
+    history = state.history
+    cont = state.cont_history
+    cont1 = prev1 * PIECE_TO_SIZE if prev1 >= 0 else -1
+    cont2 = prev2 * PIECE_TO_SIZE if prev2 >= 0 else -1
+    scored = []
+    for move in quiets:
+        if move == tt_move or move in refutations:
+            continue
+        score = history[side + (move & 4095)]
+        piece_to = mailbox[move & 63] * 64 + ((move >> 6) & 63)
+        if cont1 >= 0:
+            score += cont[cont1 + piece_to]
+        if cont2 >= 0:
+            score += cont[cont2 + piece_to]
+        scored.append((score, move))
+    scored.sort(reverse=True)
+    for _, move in scored:
+        yield move
+
+    for move in bad:
+        yield move
+
+
+class SearchAbort(Exception):  # noqa: N818 — сигнал остановки поиска, а не ошибка
+    pass
+
+
+def quiescence(pos: Position, ply: int, alpha: int, beta: int, state: SearchState, stop_event: threading.Event):
+    if state.nodes >= state.next_check:
+        state.poll(stop_event)
     state.nodes += 1
-    stand_pat = evaluate(board)
+    stats = state.stats
+    if stats is not None:
+        stats.qnodes += 1
+    state.seldepth = max(state.seldepth, ply)
+    if pos.is_insufficient_material():
+        return 0
+    # без взятий мат не увидеть: полный перебор ходов нужен только под шахом
+    if pos.in_check() and not pos.has_legal_move():
+        return -INF + ply
+    stand_pat = stats.evaluate(pos) if stats is not None else evaluate(pos)
     if stand_pat >= beta:
         return beta
-    if alpha < stand_pat:
-        alpha = stand_pat
+    alpha = max(alpha, stand_pat)
 
-    captures = [m for m in board.legal_moves if board.is_capture(m)]
+    if stats is not None:
+        captures = stats.captures(pos)
+    else:
+        captures = []
+        pos.gen_noisy(captures)
+        captures.sort(key=lambda mv: -mvv_lva_score(pos, mv))
     if not captures:
         return alpha
-    captures.sort(key=lambda mv: -mvv_lva_score(board, mv))
 
+    mailbox = pos.mailbox
+    # delta pruning: даже лучший мыслимый выигрыш материала не дотянет до alpha
+    futility_base = stand_pat + QS_DELTA_MARGIN
     for move in captures:
-        if stop_event.is_set():
-            raise SearchAbort()
-        board.push(move)
+        if not (move >> 12) & 7:
+            victim = mailbox[(move >> 6) & 63]
+            gain = PIECE_INDEX_VALUES[victim] if victim >= 0 else PIECE_VALUES[PAWN]
+            if futility_base + gain <= alpha:
+                continue
+        # проигрывающие по SEE взятия в quiescence не смотрим
+        if not pos.see_ge(move, 0):
+            continue
+        if not pos.make(move):
+            continue
         try:
-            score = -quiescence(board, -beta, -alpha, state, stop_event)
+            score = -quiescence(pos, ply + 1, -beta, -alpha, state, stop_event)
         finally:
-            board.pop()
+            pos.unmake(move)
         if score >= beta:
             return beta
-        if score > alpha:
-            alpha = score
+        alpha = max(alpha, score)
     return alpha
 
 # ---- Negamax с alpha-beta и TT ----
 
-def negamax(board: chess.Board, depth: int, alpha: int, beta: int, state: SearchState, stop_event: threading.Event):
-    if stop_event.is_set():
-        raise SearchAbort()
-    if state.start_time and (time.time() - state.start_time) > state.time_limit:
-        raise SearchAbort()
-
+# горячий путь поиска: разбиение на функции добавило бы вызов на каждый узел
+def negamax(  # noqa: PLR0912, PLR0915
+    pos: Position, depth: int, ply: int, alpha: int, beta: int, state: SearchState, stop_event: threading.Event
+):
+    if state.nodes >= state.next_check:
+        state.poll(stop_event)
     state.nodes += 1
+    state.pv_len[ply] = ply
+    state.seldepth = max(state.seldepth, ply)
 
-    if depth == 0:
-        return quiescence(board, alpha, beta, state, stop_event)
-
-    key = fast_board_key(board)
-    tt_entry = state.tt.get(key)
-    if tt_entry and tt_entry.depth >= depth:
-        if tt_entry.flag == 'EXACT':
-            return tt_entry.score
-        elif tt_entry.flag == 'LOWER':
-            alpha = max(alpha, tt_entry.score)
-        elif tt_entry.flag == 'UPPER':
-            beta = min(beta, tt_entry.score)
-        if alpha >= beta:
-            return tt_entry.score
+    # ничья по правилу 50 ходов, повторению или недостатку материала
+    if pos.halfmove >= 100 or pos.is_repetition() or pos.is_insufficient_material():
+        return 0
 
-    alpha_orig = alpha
-    beta_orig = beta
+    if depth == 0 or ply >= MAX_PLY:
+        return quiescence(pos, ply, alpha, beta, state, stop_event)
+
+    key = pos.key
+    stats = state.stats
+    tt_entry = state.tt.probe(key) if stats is None else stats.probe(state.tt, key)
+    pv_node = beta - alpha > 1
+    # в PV-узлах по TT не отсекаемся, иначе линия обрывается на попадании в таблицу
+    if tt_entry and tt_entry.depth >= depth and not pv_node:
+        tt_score = score_from_tt(tt_entry.score, ply)
+        if tt_entry.flag == TT_EXACT:
+            if stats is not None:
+                stats.tt_cutoffs += 1
+            return tt_score
+        if tt_entry.flag == TT_LOWER:
+            alpha = max(alpha, tt_score)
+        elif tt_entry.flag == TT_UPPER:
+            beta = min(beta, tt_score)
+        if alpha >= beta:
+            if stats is not None:
+                stats.tt_cutoffs += 1
+            return tt_score
 
     best_score = -INF
-    best_move = None
-
-    moves = list(board.legal_moves)
-
-    def move_key(mv):
-        if tt_entry and tt_entry.best_move and mv == tt_entry.best_move:
-            return (0, 0, 0)
-        cap = 0 if board.is_capture(mv) else 1
-        mvv = -mvv_lva_score(board, mv)
-        hist = -state.history[(board.turn, mv.from_square, mv.to_square)]
-        return (cap, mvv, hist)
+    best_move = 0
+    # верхняя граница от эндшпильных баз для PV-узла (проигрыш по базам поиск не улучшит)
+    max_score = INF
+
+    # эндшпильные базы: точный WDL сразу после взятия или хода пешкой (50-ходовой счётчик обнулён)
+    tablebase = state.tablebase
+    if (
+        tablebase is not None
+        and pos.halfmove == 0
+        and not pos.castling
+        and pos.occupied.bit_count() <= state.params.syzygy_probe_limit
+    ):
+        wdl = tablebase.get_wdl(pos.to_board())
+        if wdl is not None:
+            state.tbhits += 1
+            # cursed win / blessed loss (±1) — ничья по правилу 50 ходов
+            if wdl > 1:
+                tb_score, tb_flag = TB_WIN - ply, TT_LOWER
+            elif wdl < -1:
+                tb_score, tb_flag = -TB_WIN + ply, TT_UPPER
+            else:
+                tb_score, tb_flag = 0, TT_EXACT
+            if (
+                tb_flag == TT_EXACT
+                or (tb_flag == TT_LOWER and tb_score >= beta)
+                or (tb_flag == TT_UPPER and tb_score <= alpha)
+            ):
+                state.tt.store(key, min(depth + TB_DEPTH_BONUS, MAX_PLY), tb_flag, score_to_tt(tb_score, ply), 0)
+                return tb_score
+            # в PV-узле ищем дальше ради линии, но оценку ограничиваем результатом баз
+            if pv_node:
+                if tb_flag == TT_LOWER:
+                    best_score = tb_score
+                    alpha = max(alpha, tb_score)
+                else:
+                    max_score = tb_score
 
-    moves.sort(key=move_key)
+    alpha_orig = alpha
+    beta_orig = beta
 
+    state.killers[ply + 1][0] = state.killers[ply + 1][1] = 0
+    mailbox = pos.mailbox
+    stack = state.stack
+    params = state.params
+    quiets_tried = []
+
+    in_check = pos.in_check()
+    static_eval = None
+    if not in_check and not pv_node:
+        static_eval = evaluate(pos) if stats is None else stats.evaluate(pos)
+
+        # reverse futility: запас над beta слишком велик, чтобы его отыграть за depth ходов
+        if (
+            params.reverse_futility
+            and depth <= RFP_MAX_DEPTH
+            and abs(beta) < MATE_BOUND
+            and static_eval - params.reverse_futility_margin * depth >= beta
+        ):
+            return static_eval
+
+        # razoring: безнадёжно ниже alpha — проверяем только взятиями
+        if params.razoring and depth <= RAZOR_MAX_DEPTH and static_eval + params.razor_margin * depth < alpha:
+            score = quiescence(pos, ply, alpha, alpha + 1, state, stop_event)
+            if score <= alpha:
+                return score
+
+        # null move: без лёгких/тяжёлых фигур велик риск цугцванга; два null подряд не делаем
+        if (
+            params.null_move
+            and depth >= NULL_MIN_DEPTH
+            and static_eval >= beta
+            and stack[ply - 1] >= 0
+            and pos.has_non_pawn_material(pos.side)
+        ):
+            reduction = params.null_move_reduction + depth // 4
+            stack[ply] = -1
+            pos.make_null()
+            try:
+                score = -negamax(pos, max(0, depth - 1 - reduction), ply + 1, -beta, -beta + 1, state, stop_event)
+            finally:
+                pos.unmake_null()
+            if score >= beta:
+                return beta if score >= MATE_BOUND else score
+
+    legal = 0
+    moves = pick_moves(pos, state, ply, tt_entry.best_move if tt_entry else 0)
+    if stats is not None:
+        moves = stats.moves(moves)
     for move in moves:
-        if stop_event.is_set():
-            raise SearchAbort()
-        mover = board.turn  # сторона, делающая ход
-        board.push(move)
+        is_quiet = not pos.is_capture(move) and not (move >> 12) & 7
+
+        if legal and is_quiet and static_eval is not None and best_score > -MATE_BOUND:
+            # late move pruning: поздние тихие ходы на малой глубине не смотрим
+            if (
+                params.late_move_pruning
+                and depth <= LMP_MAX_DEPTH
+                and len(quiets_tried) >= params.lmp_base + depth * depth
+            ):
+                continue
+            # futility: тихий ход не поднимет оценку до alpha
+            if (
+                params.futility
+                and depth <= FUTILITY_MAX_DEPTH
+                and static_eval + params.futility_margin * depth <= alpha
+            ):
+                continue
+
+        stack[ply] = mailbox[move & 63] * 64 + ((move >> 6) & 63)
+        if not pos.make(move):
+            continue
+        legal += 1
         try:
-            score = -negamax(board, depth - 1, -beta, -alpha, state, stop_event)
+            if legal == 1:
+                score = -negamax(pos, depth - 1, ply + 1, -beta, -alpha, state, stop_event)
+            else:
+                # LMR: поздние тихие ходы сначала смотрим на меньшую глубину
+                reduction = 0
+                if params.lmr and is_quiet and depth >= LMR_MIN_DEPTH and not in_check:
+                    reduction = params.lmr_table[min(depth, LMR_TABLE_SIZE - 1)][min(legal, LMR_TABLE_SIZE - 1)]
+                    if pv_node:
+                        reduction -= 1
+                    if pos.in_check():
+                        reduction -= 1
+                    reduction = max(0, min(reduction, depth - 2))
+                # PVS: нулевое окно, перепоиск полным окном, только если ход попал внутрь
+                score = -negamax(pos, depth - 1 - reduction, ply + 1, -alpha - 1, -alpha, state, stop_event)
+                if reduction and score > alpha:
+                    score = -negamax(pos, depth - 1, ply + 1, -alpha - 1, -alpha, state, stop_event)
+                if alpha < score < beta:
+                    score = -negamax(pos, depth - 1, ply + 1, -beta, -alpha, state, stop_event)
         finally:
-            board.pop()
+            pos.unmake(move)
+        if is_quiet:
+            quiets_tried.append(move)
 
         if score > best_score:
             best_score = score
@@ -240,154 +2372,706 @@ def negamax(board: chess.Board, depth: int, alpha: int, beta: int, state: Search
 
         if score > alpha:
             alpha = score
-            # обновляем history для хода, который привёл к улучшению
-            if not board.is_capture(move):
-                state.history[(mover, move.from_square, move.to_square)] += 2 ** depth
+            if pv_node:
+                # линия этого узла: ход + линия потомка
+                line = state.pv[ply]
+                child_len = state.pv_len[ply + 1]
+                line[ply] = move
+                line[ply + 1:child_len] = state.pv[ply + 1][ply + 1:child_len]
+                state.pv_len[ply] = max(child_len, ply + 1)
 
         if alpha >= beta:
-            # beta-cutoff: запомним ход
-            state.history[(mover, move.from_square, move.to_square)] += 2 ** depth
+            # beta-cutoff: запомним тихий ход в killers/countermove/history
+            if is_quiet:
+                update_quiet_stats(pos, state, ply, move, quiets_tried, depth)
+            if stats is not None:
+                stats.cutoffs += 1
+                if legal == 1:
+                    stats.first_move_cutoffs += 1
             break
 
+    if not legal:
+        # мат или пат
+        return -INF + ply if in_check else 0
+    best_score = min(best_score, max_score)
+
     if best_score >= beta_orig:
-        flag = 'LOWER'
+        flag = TT_LOWER
     elif best_score <= alpha_orig:
-        flag = 'UPPER'
+        flag = TT_UPPER
     else:
-        flag = 'EXACT'
+        flag = TT_EXACT
 
-    state.tt[key] = TTEntry(depth=depth, flag=flag, score=best_score, best_move=best_move)
+    state.tt.store(key, depth, flag, score_to_tt(best_score, ply), best_move)
     return best_score
 
-# ---- SearchThread (итеративное углубление) ----
-class SearchThread(threading.Thread):
-    def __init__(self, root_board: chess.Board, wtime=None, btime=None, winc=0, binc=0, movetime=None, max_depth=None, stop_event=None):
-        super().__init__()
-        self.root_board = root_board.copy()
-        self.wtime = wtime
-        self.btime = btime
-        self.winc = winc or 0
-        self.binc = binc or 0
-        self.movetime = movetime
-        self.max_depth = max_depth
-        self.stop_event = stop_event or threading.Event()
+# ---- Итеративное углубление ----
 
-        self.best_move = None
-        self.best_score = None
-        self.depth_reached = 0
+def order_root_moves(pos: Position, moves: list, tt_move: int):
+    def root_key_fn(mv):
+        if mv == tt_move:
+            return (0, 0)
+        cap = 0 if pos.is_capture(mv) else 1
+        mvv = -mvv_lva_score(pos, mv)
+        return (cap, mvv)
 
-        self.state = SearchState()
-        self.state.time_limit = 0.0
-        self.state.start_time = 0.0
+    moves.sort(key=root_key_fn)
 
-    def time_remaining_ms(self):
-        if self.movetime:
-            return self.movetime
 
-        # определяем оставшееся время
-        if self.root_board.turn == chess.WHITE:
-            remaining = self.wtime
-            inc = self.winc
-        else:
-            remaining = self.btime
-            inc = self.binc
+def search_root(
+    pos: Position, moves: list, depth: int, alpha: int, beta: int, state: SearchState, stop_event,
+    first: int = 0, on_root_move=None,
+):
+    """
+    Одна итерация по корню с PVS: первый ход — полным окном, остальные — нулевым
+    с перепоиском, если ход оказался внутри окна. Ищутся ходы moves[first:].
+    Возвращает (best_move, best_score); линия лучшего хода — в state.pv[0][:state.pv_len[0]].
+    Перед каждым ходом вызывает on_root_move(depth, move, номер хода с 1).
+    """
+    best_move = None
+    best_score = -INF
+    for i in range(first, len(moves)):
+        mv = moves[i]
+        if stop_event.is_set():
+            break
+        if on_root_move is not None:
+            on_root_move(depth, mv, i + 1)
+        # make once, unmake once (без двойного отката даже при исключениях)
+        state.stack[0] = pos.mailbox[mv & 63] * 64 + ((mv >> 6) & 63)
+        nodes_before = state.nodes
+        pos.make(mv)
+        try:
+            if i == first:
+                score = -negamax(pos, depth - 1, 1, -beta, -alpha, state, stop_event)
+            else:
+                score = -negamax(pos, depth - 1, 1, -alpha - 1, -alpha, state, stop_event)
+                if alpha < score < beta:
+                    score = -negamax(pos, depth - 1, 1, -beta, -alpha, state, stop_event)
+        finally:
+            # гарантированно откатываем ход ровно один раз
+            pos.unmake(mv)
+        state.root_nodes[mv] = state.root_nodes.get(mv, 0) + state.nodes - nodes_before
 
-        if remaining is None:
-            return 10000
+        if score > best_score:
+            best_score = score
+            best_move = mv
+            line = state.pv[0]
+            child_len = state.pv_len[1]
+            line[0] = mv
+            line[1:child_len] = state.pv[1][1:child_len]
+            state.pv_len[0] = max(child_len, 1)
+        alpha = max(alpha, score)
+        if score >= beta:
+            break
+
+        # тайм-чек между корневыми ходами
+        if state.out_of_time():
+            break
+    return best_move, best_score
 
-        # ---- PANIC MODE (флаг падает) ----
-        # при <= 1 секунде поиск не имеет смысла
-        if remaining <= 1000:
-            return 0
 
-        # ---- LOW TIME MODE ----
-        # быстрый, неглубокий поиск
-        if remaining <= 3000:
-            return max(20, remaining // 40)
+def iterative_deepening(
+    pos: Position, state: SearchState, stop_event, max_depth, on_iteration, start_depth: int = 1, root_moves=None,
+    multipv: int = 1, on_root_move=None,
+):
+    """
+    Итеративное углубление по корню с aspiration-окнами вокруг оценки прошлой итерации.
+    MultiPV: на каждой глубине k-я линия ищется среди ходов, не вошедших в первые k-1.
+    После каждой завершённой (или прерванной по времени между корневыми ходами)
+    итерации вызывает on_iteration(depth, lines), где lines — [(score, pv), ...] от лучшей
+    линии; истинный результат — хватит углубляться.
+    root_moves (go searchmoves) ограничивает поиск подмножеством легальных ходов.
+    """
+    root_key = pos.key
+    depth = start_depth
+
+    # корневое упорядочивание: один раз, дальше лучшие ходы итерации поднимаются наверх
+    moves = pos.legal_moves()
+    if root_moves:
+        moves = [mv for mv in moves if mv in root_moves]
+    root_tt = state.tt.probe(root_key)
+    order_root_moves(pos, moves, root_tt.best_move if root_tt else 0)
+    multipv = max(1, min(multipv, len(moves)))
+    prev_scores = [None] * multipv
+
+    try:
+        while not stop_event.is_set() and moves:
+            if (max_depth and depth > max_depth) or depth >= MAX_PLY:
+                break
 
+            lines = []
+            for pv_idx in range(multipv):
+                prev_score = prev_scores[pv_idx]
+                if depth >= ASPIRATION_MIN_DEPTH and prev_score is not None and abs(prev_score) < MATE_BOUND:
+                    delta = ASPIRATION_DELTA
+                    alpha = max(prev_score - delta, -INF)
+                    beta = min(prev_score + delta, INF)
+                else:
+                    delta = INF
+                    alpha, beta = -INF, INF
+
+                while True:
+                    best_move, best_score = search_root(
+                        pos, moves, depth, alpha, beta, state, stop_event, first=pv_idx, on_root_move=on_root_move
+                    )
+                    out_of_time = state.out_of_time()
+                    if best_move is not None and best_score > alpha:
+                        # лучший ход (в т.ч. при fail-high) — на место своей линии в следующих поисках
+                        moves.remove(best_move)
+                        moves.insert(pv_idx, best_move)
+                    if out_of_time or stop_event.is_set():
+                        break
+                    if best_score <= alpha:
+                        # fail-low: опускаем нижнюю границу, верхнюю подтягиваем к середине
+                        beta = (alpha + beta) // 2
+                        alpha = max(best_score - delta, -INF)
+                    elif best_score >= beta:
+                        beta = min(best_score + delta, INF)
+                    else:
+                        break
+                    delta += delta // 2
 
-        return max(20, remaining // 20 + inc * 2)
+                if best_move is None or best_score <= alpha:
+                    break
+                if pv_idx == 0 and best_score < beta:
+                    state.tt.store(root_key, depth, TT_EXACT, best_score, best_move)
+                prev_scores[pv_idx] = best_score
+                lines.append((best_score, state.pv[0][:state.pv_len[0]]))
+                if out_of_time or stop_event.is_set():
+                    break
 
-    def run(self):
-        ms = self.time_remaining_ms()
-        self.state.time_limit = ms / 1000.0
-        self.state.start_time = time.time()
+            if lines and on_iteration(depth, lines):
+                break
 
-        depth = 1
-        try:
-            while not self.stop_event.is_set():
-                if self.max_depth and depth > self.max_depth:
+            # лёгкий ход: проверяем, что остальные ходы уступают лучшему с запасом
+            manager = state.time_manager
+            if (
+                manager is not None
+                and not manager.fixed
+                and depth == TM_EASY_MOVE_DEPTH
+                and multipv == 1
+                and len(moves) > 1
+                and lines
+                and abs(lines[0][0]) < MATE_BOUND
+            ):
+                threshold = lines[0][0] - TM_EASY_MOVE_MARGIN
+                # проверка не должна подменить узлы по корневым ходам и PV настоящей итерации
+                root_nodes = dict(state.root_nodes)
+                root_pv, root_pv_len = state.pv[0][:], state.pv_len[0]
+                _, other_score = search_root(
+                    pos, moves, depth - TM_EASY_MOVE_REDUCTION, threshold - 1, threshold, state, stop_event, first=1
+                )
+                state.root_nodes = root_nodes
+                state.pv[0][:] = root_pv
+                state.pv_len[0] = root_pv_len
+                if other_score < threshold and not stop_event.is_set() and not state.out_of_time():
+                    manager.mark_easy_move(moves[0])
+
+            # мягкий лимит: следующую итерацию начинаем, только если на неё есть время
+            if state.time_manager is not None and lines:
+                best_score, best_line = lines[0]
+                total = sum(state.root_nodes.values())
+                fraction = state.root_nodes.get(best_line[0], 0) / total if total else 1.0
+                if state.elapsed() > state.time_manager.soft_limit(best_line[0], best_score, fraction):
                     break
-                self.depth_reached = depth
+            if state.out_of_time():
+                break
 
-                # корневое упорядочивание
-                moves = list(self.root_board.legal_moves)
-                root_key = fast_board_key(self.root_board)
-                root_tt = self.state.tt.get(root_key)
+            depth += 1
 
-                def root_key_fn(mv):
-                    if root_tt and root_tt.best_move and mv == root_tt.best_move:
-                        return (0, 0)
-                    cap = 0 if self.root_board.is_capture(mv) else 1
-                    mvv = -mvv_lva_score(self.root_board, mv)
-                    return (cap, mvv)
+    except SearchAbort:
+        # корректное окончание
+        pass
 
-                moves.sort(key=root_key_fn)
+# ---- Lazy SMP ----
 
-                best_for_depth = None
-                best_score_for_depth = -INF
+class SharedFlag:
+    """Флаг остановки в общей памяти с интерфейсом threading.Event; is_set() без блокировок."""
 
-                for mv in moves:
-                    if self.stop_event.is_set():
-                        break
-                    mover = self.root_board.turn
-                    # push once, pop once (без двойного pop даже при исключениях)
-                    self.root_board.push(mv)
-                    try:
-                        score = -negamax(self.root_board, depth - 1, -INF, INF, self.state, self.stop_event)
-                    except SearchAbort:
-                        # просто пробрасываем, но НЕ вызываем pop здесь
-                        raise
-                    finally:
-                        # гарантированно снимаем ход ровно один раз
-                        self.root_board.pop()
-
-                    if score > best_score_for_depth:
-                        best_score_for_depth = score
-                        best_for_depth = mv
-
-                    # тайм-чек между корневыми ходами
-                    if (time.time() - self.state.start_time) > self.state.time_limit:
-                        break
+    def __init__(self, value):
+        self.value = value
 
-                if best_for_depth is not None:
-                    self.best_move = best_for_depth
-                    self.best_score = best_score_for_depth
-                    elapsed = time.time() - self.state.start_time
-                    nps = int(self.state.nodes / elapsed) if elapsed > 0 else 0
-                    try:
-                        pv_str = self.best_move.uci()
-                    except Exception:
-                        pv_str = "-"
-                    print(f"info depth {depth} score cp {best_score_for_depth} time {int(elapsed*1000)} nodes {self.state.nodes} nps {nps} pv {pv_str}")
-                    sys.stdout.flush()
+    def is_set(self) -> bool:
+        return self.value.value != 0
+
+    def set(self):
+        self.value.value = 1
+
+    def clear(self):
+        self.value.value = 0
+
+
+def smp_worker(worker_id: int, shm_name: str, buckets: int, stop_value, jobs, results):
+    """
+    Вспомогательный процесс Lazy SMP: ищет тот же корень, что и главный поток,
+    со сдвигом стартовой глубины, и делится результатами через общую таблицу.
+    Завершённые итерации отправляются главному потоку.
+    """
+    load_deferred()
+    tt = TranspositionTable.attach(shm_name, buckets)
+    stop_flag = SharedFlag(stop_value)
+    # история помощника, как и у главного потока, живёт до смены партии
+    state = None
+    state_game = None
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        search_id, game_id, board, max_depth, start_ns, deadline_ns, age, params, search_moves = job
+        if state is None or state_game != game_id:
+            state = SearchState(tt, params)
+            state_game = game_id
+        state.params = params
+        state.new_search()
+        # поколение таблицы задаёт главный процесс
+        tt.age = age
+        state.start_ns = start_ns
+        state.deadline_ns = deadline_ns
+        pos = Position.from_board(board)
+        pos.set_network(state.network)
+        root_moves = [pos.from_chess_move(move) for move in search_moves]
+
+        def report(depth, lines, search_id=search_id, pos=pos, state=state):
+            score, line = lines[0]
+            results.put(("iter", search_id, worker_id, depth, score, pos.move_uci(line[0]), state.nodes))
+
+        try:
+            iterative_deepening(
+                pos, state, stop_flag, max_depth, report, start_depth=1 + worker_id % 2, root_moves=root_moves
+            )
+        except Exception as e:
+            print(f"Helper {worker_id} error:", e, file=sys.stderr)
+            sys.stderr.flush()
+        results.put(("done", search_id, worker_id, 0, 0, None, state.nodes))
+    tt.release()
+
+
+class SmpPool:
+    """Пул вспомогательных процессов для Threads > 1. Процессы живут между ходами."""
+
+    def __init__(self, helpers: int, tt: TranspositionTable):
+        import multiprocessing  # noqa: PLC0415 — ленивый импорт: нужен только при Threads > 1
+
+        ctx = multiprocessing.get_context()
+        self.stop_flag = SharedFlag(ctx.RawValue("b", 0))
+        self.results = ctx.Queue()
+        self.jobs = []
+        self.processes = []
+        self.search_id = 0
+        self.pending = 0
+        self.best = None
+        self.nodes = [0] * helpers
+        for i in range(helpers):
+            jobs = ctx.Queue()
+            process = ctx.Process(
+                target=smp_worker,
+                args=(i + 1, tt.shm_name, tt.buckets, self.stop_flag.value, jobs, self.results),
+                daemon=True,
+            )
+            process.start()
+            self.jobs.append(jobs)
+            self.processes.append(process)
+
+    def start(
+        self, game_id: int, board: chess.Board, max_depth, start_ns: int, deadline_ns: int, age: int,
+        params: SearchParams, search_moves: list,
+    ):
+        self.search_id += 1
+        self.pending = len(self.jobs)
+        self.best = None
+        self.nodes = [0] * len(self.jobs)
+        self.stop_flag.clear()
+        for jobs in self.jobs:
+            jobs.put((self.search_id, game_id, board, max_depth, start_ns, deadline_ns, age, params, search_moves))
+
+    def stop(self):
+        self.stop_flag.set()
+
+    def _handle(self, message):
+        kind, search_id, worker_id, depth, score, move, nodes = message
+        if search_id != self.search_id:
+            return
+        self.nodes[worker_id - 1] = nodes
+        if kind == "done":
+            self.pending -= 1
+        elif self.best is None or depth > self.best[0]:
+            self.best = (depth, score, move)
+
+    def poll(self):
+        """Забирает накопившиеся результаты без ожидания."""
+        import queue  # noqa: PLC0415 — ленивый импорт вместе с multiprocessing
+
+        while True:
+            try:
+                self._handle(self.results.get_nowait())
+            except queue.Empty:
+                return
+
+    def wait_idle(self, timeout: float = 1.0):
+        """Ждёт, пока помощники закончат текущий поиск (перед очисткой общей таблицы)."""
+        import queue  # noqa: PLC0415 — ленивый импорт вместе с multiprocessing
+
+        deadline = time.time() + timeout
+        while self.pending > 0:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                self._handle(self.results.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+    @property
+    def helper_nodes(self) -> int:
+        return sum(self.nodes)
+
+    def close(self):
+        self.stop_flag.set()
+        for jobs in self.jobs:
+            jobs.put(None)
+        for process in self.processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+
+# ---- Управление временем ----
+
+TM_DEFAULT_MOVES_TO_GO = 30
+TM_MAX_MOVES_TO_GO = 50
+# жёсткий лимит: во сколько раз больше мягкого и какую долю остатка можно отдать одному ходу
+TM_HARD_RATIO = 3
+TM_HARD_FRACTION = 0.3
+TM_MAX_FRACTION = 0.9
+# множитель мягкого лимита по числу итераций подряд с тем же лучшим ходом
+TM_STABILITY_SCALE = [1.5, 1.25, 1.05, 0.9, 0.8, 0.7]
+# падение оценки на TM_SCORE_DROP_MAX и больше даёт до +TM_SCORE_DROP_BONUS к лимиту
+TM_SCORE_DROP_MAX = 150
+TM_SCORE_DROP_BONUS = 0.6
+# доля узлов на лучшем ходу: (TM_NODE_BASE - доля) * TM_NODE_SCALE
+TM_NODE_BASE = 1.5
+TM_NODE_SCALE = 1.25
+# все множители вместе растягивают мягкий лимит не больше чем в TM_MAX_SCALE раз
+TM_MAX_SCALE = 2.5
+# лёгкий ход: после итерации TM_EASY_MOVE_DEPTH все остальные ходы на глубине меньше на
+# TM_EASY_MOVE_REDUCTION хуже лучшего хотя бы на TM_EASY_MOVE_MARGIN — мягкий лимит режется до доли
+TM_EASY_MOVE_DEPTH = 5
+TM_EASY_MOVE_REDUCTION = 2
+TM_EASY_MOVE_MARGIN = 150
+TM_EASY_MOVE_FRACTION = 0.2
+DEFAULT_MOVE_TIME_MS = 10000
+
+
+class TimeManager:
+    """
+    Два лимита на ход: мягкий — новую итерацию не начинаем, жёсткий — прерываем поиск.
+    Мягкий пересчитывается после каждой итерации: устойчивый лучший ход и узлы,
+    почти целиком ушедшие в него, сокращают время; смена хода и падение оценки — добавляют.
+    go movetime — фиксированное время: ищем ровно столько, мягкий лимит равен жёсткому.
+    """
+
+    def __init__(self, soft_ms: float, hard_ms: float, fixed: bool = False):
+        self.soft = soft_ms / 1000.0
+        self.hard = hard_ms / 1000.0
+        self.fixed = fixed
+        self.best_move = None
+        self.stability = 0
+        self.prev_score = None
+        self.easy_move = None
+
+    @classmethod
+    def from_clock(
+        cls, turn: chess.Color, wtime=None, btime=None, winc=0, binc=0, movetime=None, movestogo=None,
+        overhead: int = DEFAULT_MOVE_OVERHEAD,
+    ) -> TimeManager:
+        if movetime:
+            ms = max(1, movetime - overhead)
+            return cls(ms, ms, fixed=True)
+
+        remaining, inc = (wtime, winc) if turn == chess.WHITE else (btime, binc)
+        if remaining is None:
+            return cls(DEFAULT_MOVE_TIME_MS, DEFAULT_MOVE_TIME_MS)
+        inc = inc or 0
+
+        # задержка связи съедает часть каждого хода — её резервируем заранее
+        usable = max(1, remaining - overhead)
+        mtg = max(1, min(movestogo, TM_MAX_MOVES_TO_GO)) if movestogo else TM_DEFAULT_MOVES_TO_GO
+        soft = usable / mtg + inc * 3 / 4
+        # чем ближе контроль, тем большую долю остатка можно отдать одному ходу
+        hard = min(soft * TM_HARD_RATIO, usable * min(TM_MAX_FRACTION, max(TM_HARD_FRACTION, 3 / mtg)))
+        soft = min(soft, hard)
+        return cls(max(1, soft), max(1, hard))
+
+    def soft_limit(self, best_move: int, score: int, node_fraction: float) -> float:
+        """Мягкий лимит в секундах после очередной завершённой итерации."""
+        if self.fixed:
+            return self.hard
+        if best_move == self.best_move:
+            self.stability = min(self.stability + 1, len(TM_STABILITY_SCALE) - 1)
+        else:
+            self.best_move = best_move
+            self.stability = 0
+        scale = TM_STABILITY_SCALE[self.stability]
+
+        if self.prev_score is not None and score < self.prev_score and abs(score) < MATE_BOUND:
+            drop = min(self.prev_score - score, TM_SCORE_DROP_MAX)
+            scale *= 1 + TM_SCORE_DROP_BONUS * drop / TM_SCORE_DROP_MAX
+        self.prev_score = score
+
+        scale = min(scale * (TM_NODE_BASE - node_fraction) * TM_NODE_SCALE, TM_MAX_SCALE)
+        if best_move == self.easy_move:
+            scale = min(scale, TM_EASY_MOVE_FRACTION)
+        return min(self.soft * scale, self.hard)
 
-                if (time.time() - self.state.start_time) > self.state.time_limit:
+    def mark_easy_move(self, move: int):
+        """Ход заметно лучше остальных: пока он остаётся лучшим, долго не думаем."""
+        self.easy_move = move
+
+# ---- SearchThread (итеративное углубление) ----
+
+# currmove — только если поиск идёт дольше секунды; общая статистика — не чаще раза в секунду
+CURRMOVE_MIN_NS = 1_000_000_000
+INFO_INTERVAL_NS = 1_000_000_000
+
+
+# лимиты одной команды go; поля, которых в команде не было, остаются по умолчанию
+SearchLimits = namedtuple(
+    "SearchLimits",
+    [
+        "wtime", "btime", "winc", "binc", "movetime", "movestogo", "max_depth", "nodes", "mate",
+        "ponder", "infinite", "search_moves",
+    ],
+    defaults=(None, None, 0, 0, None, None, None, None, None, False, False, ()),
+)
+
+
+class SearchThread(threading.Thread):
+    def __init__(
+        self, root_board: chess.Board, limits: SearchLimits | None = None, *, stop_event=None, state=None,
+        smp_pool=None, game_id=0, move_overhead=DEFAULT_MOVE_OVERHEAD, multipv=1,
+    ):
+        super().__init__()
+        if limits is None:
+            limits = SearchLimits()
+        self.root_board = root_board.copy()
+        self.wtime = limits.wtime
+        self.btime = limits.btime
+        self.winc = limits.winc or 0
+        self.binc = limits.binc or 0
+        self.movetime = limits.movetime
+        self.movestogo = limits.movestogo
+        self.move_overhead = move_overhead
+        self.max_depth = limits.max_depth
+        self.nodes = limits.nodes
+        # go mate N: хватит искать, как только найден мат не длиннее N ходов
+        self.mate = limits.mate
+        self.multipv = multipv
+        self.search_moves = [move for move in limits.search_moves if move in root_board.legal_moves]
+        self.stop_event = stop_event or threading.Event()
+        self.smp_pool = smp_pool
+        # пул, реально участвующий в текущем поиске (None — ищет один главный поток)
+        self.active_pool = None
+        self.game_id = game_id
+        # go ponder / go infinite: без лимита времени, bestmove — только после ponderhit или stop
+        self.ponder = limits.ponder
+        self.infinite = limits.infinite
+        self.started = 0
+        self.last_info_ns = 0
+
+        self.best_move = None
+        self.best_score = None
+        self.pv = []
+        self.depth_reached = 0
+
+        # состояние поиска принадлежит партии, а не ходу: TT и история переживают go
+        self.state = state if state is not None else SearchState()
+
+    def time_manager(self) -> TimeManager:
+        return TimeManager.from_clock(
+            self.root_board.turn, self.wtime, self.btime, self.winc, self.binc,
+            self.movetime, self.movestogo, self.move_overhead,
+        )
+
+    def start_clock(self):
+        """Лимиты отсчитываются от текущего момента (старт go или ponderhit)."""
+        manager = self.time_manager()
+        # сначала старт отсчёта, потом лимит: поток поиска не должен увидеть старый старт с новым лимитом
+        start_ns = time.perf_counter_ns()
+        self.state.start_ns = start_ns
+        self.state.deadline_ns = start_ns + int(manager.hard * 1e9)
+        self.state.time_manager = manager
+
+    def ponderhit(self):
+        """Соперник сыграл ожидаемый ход: тот же поиск продолжается, но уже по часам."""
+        if not self.ponder:
+            return
+        self.start_clock()
+        self.ponder = False
+
+    def ponder_move(self, pos: Position):
+        """Ожидаемый ответ соперника — второй ход PV, а если линия короче — ход из TT."""
+        if len(self.pv) >= 2 and self.pv[0] == self.best_move:
+            return self.pv[1]
+        move = pos.from_chess_move(self.best_move)
+        if not pos.make(move):
+            return None
+        try:
+            entry = self.state.tt.probe(pos.key)
+            reply = entry.best_move if entry else 0
+            if reply and pos.is_pseudo_legal(reply) and pos.make(reply):
+                pos.unmake(reply)
+                return pos.to_chess_move(reply)
+        finally:
+            pos.unmake(move)
+        return None
+
+    def helper_pv(self, pos: Position, first_move: chess.Move) -> list:
+        """Линия помощника: его ход и продолжение по общей TT, куда помощник записал свою PV."""
+        line = []
+        made = []
+        seen = set()
+        move = pos.from_chess_move(first_move)
+        try:
+            while move and len(made) < self.depth_reached and pos.key not in seen:
+                seen.add(pos.key)
+                if not pos.is_pseudo_legal(move) or not pos.make(move):
                     break
+                made.append(move)
+                line.append(pos.to_chess_move(move))
+                entry = self.state.tt.probe(pos.key)
+                move = entry.best_move if entry else 0
+        finally:
+            for move in reversed(made):
+                pos.unmake(move)
+        return line or [first_move]
+
+    def search_stats(self) -> str:
+        """Общая часть info: время, узлы (с помощниками), nps, hashfull, tbhits."""
+        nodes = self.state.nodes
+        if self.active_pool:
+            self.active_pool.poll()
+            nodes += self.active_pool.helper_nodes
+        elapsed = (time.perf_counter_ns() - self.started) / 1e9
+        nps = int(nodes / elapsed) if elapsed > 0 else 0
+        return (
+            f"time {int(elapsed * 1000)} nodes {nodes} nps {nps} "
+            f"hashfull {self.state.tt.hashfull()} tbhits {self.state.tbhits}"
+        )
+
+    def has_clock(self) -> bool:
+        remaining = self.wtime if self.root_board.turn == chess.WHITE else self.btime
+        return bool(self.movetime) or remaining is not None
 
-                depth += 1
+    def run(self):
+        self.started = time.perf_counter_ns()
+        self.state.new_search()
+        self.state.node_limit = self.nodes or 0
+        limited = self.nodes or self.mate or self.max_depth
+        if self.ponder or self.infinite or (limited and not self.has_clock()):
+            # время не ограничено: остановит stop, ponderhit, лимит узлов или глубины, найденный мат
+            self.state.start_ns = self.started
+            self.state.deadline_ns = 0
+            self.state.time_manager = None
+        else:
+            self.start_clock()
+        pos = Position.from_board(self.root_board)
+        pos.set_network(self.state.network)
+        root_moves = [pos.from_chess_move(move) for move in self.search_moves]
+        max_depth = self.max_depth
+        # с лимитом узлов ищет один главный поток — счёт точный и воспроизводимый
+        pool = self.smp_pool if not self.nodes else None
+        only_move = self.state.time_manager is not None and len(root_moves or pos.legal_moves()) == 1
+        if only_move:
+            # думать не о чем — отвечаем сразу, время на часах пригодится в следующих позициях;
+            # ponder-ход возьмёт ponder_move из TT
+            print("info string only move")
+            sys.stdout.flush()
+            self.best_move = pos.to_chess_move((root_moves or pos.legal_moves())[0])
+            pool = None
+        self.active_pool = pool
+        if pool:
+            pool.wait_idle()
+            pool.start(
+                self.game_id, self.root_board, max_depth, self.state.start_ns, self.state.deadline_ns,
+                self.state.tt.age, self.state.params, self.search_moves,
+            )
+
+        def report(depth, lines):
+            score, line = lines[0]
+            self.depth_reached = depth
+            self.best_move = pos.to_chess_move(line[0])
+            self.best_score = score
+            self.pv = [pos.to_chess_move(move) for move in line]
+            stats = self.search_stats()
+            for k, (line_score, line_moves) in enumerate(lines, 1):
+                pv = " ".join(pos.move_uci(move) for move in line_moves)
+                print(
+                    f"info depth {depth} seldepth {self.state.seldepth} multipv {k} score {uci_score(line_score)} "
+                    f"{stats} pv {pv}"
+                )
+            sys.stdout.flush()
+            self.last_info_ns = time.perf_counter_ns()
+            return bool(self.mate) and score >= INF - (2 * self.mate - 1)
+
+        def report_root_move(depth, move, number):
+            # на длинных итерациях GUI видит, чем занят поиск, и периодически — общую статистику
+            now = time.perf_counter_ns()
+            if now - self.started < CURRMOVE_MIN_NS:
+                return
+            print(f"info depth {depth} currmove {pos.move_uci(move)} currmovenumber {number}")
+            if now - self.last_info_ns >= INFO_INTERVAL_NS:
+                print(f"info depth {depth} seldepth {self.state.seldepth} {self.search_stats()}")
+                self.last_info_ns = now
+            sys.stdout.flush()
 
-        except SearchAbort:
-            # корректное окончание
-            pass
+        try:
+            if not only_move:
+                iterative_deepening(
+                    pos, self.state, self.stop_event, max_depth, report, root_moves=root_moves,
+                    multipv=self.multipv, on_root_move=report_root_move,
+                )
+            manager = self.state.time_manager
+            if manager is not None and manager.easy_move is not None and self.best_move == pos.to_chess_move(
+                manager.easy_move
+            ):
+                print(f"info string easy move {pos.move_uci(manager.easy_move)}")
+                sys.stdout.flush()
         except Exception as e:
             print("Search error:", e, file=sys.stderr)
             sys.stderr.flush()
 
+        if pool:
+            pool.stop()
+            pool.poll()
+            # берём самую глубокую завершённую итерацию среди всех потоков (в MultiPV — только свои линии)
+            if self.multipv == 1 and pool.best and pool.best[0] > self.depth_reached:
+                self.depth_reached, self.best_score, helper_move = pool.best
+                self.best_move = chess.Move.from_uci(helper_move)
+                self.pv = self.helper_pv(pos, self.best_move)
+                # GUI должен увидеть линию, из которой взят bestmove
+                pv = " ".join(move.uci() for move in self.pv)
+                print(
+                    f"info depth {self.depth_reached} seldepth {self.state.seldepth} multipv 1 "
+                    f"score {uci_score(self.best_score)} {self.search_stats()} pv {pv}"
+                )
+                sys.stdout.flush()
+
+        # поиск мог упереться в глубину раньше времени; в ponder/infinite ждём ponderhit или stop
+        while (self.ponder or self.infinite) and not self.stop_event.is_set():
+            self.stop_event.wait(0.01)
+
+        if self.state.stats is not None:
+            for line in self.state.stats.info_lines(self.state.nodes):
+                print(line)
+            sys.stdout.flush()
+
         # По завершении — печатаем bestmove (UCI требует вывод bestmove при завершении поиска)
         if self.best_move:
             try:
-                print(f"bestmove {self.best_move.uci()}")
+                ponder = self.ponder_move(pos)
+                if ponder:
+                    print(f"bestmove {self.best_move.uci()} ponder {ponder.uci()}")
+                else:
+                    print(f"bestmove {self.best_move.uci()}")
                 sys.stdout.flush()
             except Exception:
                 print("bestmove 0000")
@@ -395,7 +3079,7 @@ class SearchThread(threading.Thread):
         else:
             # если ничего не найдено, попробуем любой легальный ход
             try:
-                fb = next(iter(self.root_board.legal_moves))
+                fb = self.search_moves[0] if self.search_moves else next(iter(self.root_board.legal_moves))
                 print(f"bestmove {fb.uci()}")
                 sys.stdout.flush()
             except StopIteration:
@@ -404,15 +3088,111 @@ class SearchThread(threading.Thread):
 
 # ---- UCI loop ----
 
-def uci_loop():
-    board = chess.Board()
-    search_thread = None
-    stop_event = threading.Event()
+def send_uci_id():
     print("id name DarkOnEngine")
     print("id author Dark and Classic")
+    print(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}")
+    print(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+    print(f"option name Move Overhead type spin default {DEFAULT_MOVE_OVERHEAD} min 0 max {MAX_MOVE_OVERHEAD}")
+    print(f"option name MultiPV type spin default 1 min 1 max {MAX_MULTIPV}")
+    print("option name Ponder type check default false")
+    print("option name UCI_Chess960 type check default false")
+    for option_line in SearchParams.uci_lines():
+        print(option_line)
     print("uciok")
     sys.stdout.flush()
 
+
+def parse_setoption(parts):
+    """setoption name <id> [value <x>] -> (name, value); имя может содержать пробелы."""
+    if "name" not in parts:
+        return None, None
+    name_idx = parts.index("name") + 1
+    if "value" in parts[name_idx:]:
+        value_idx = parts.index("value", name_idx)
+        return " ".join(parts[name_idx:value_idx]), " ".join(parts[value_idx + 1:])
+    return " ".join(parts[name_idx:]), None
+
+
+# go: параметр с числовым значением -> имя аргумента SearchThread
+GO_INT_PARAMS = {
+    "wtime": "wtime",
+    "btime": "btime",
+    "winc": "winc",
+    "binc": "binc",
+    "movestogo": "movestogo",
+    "movetime": "movetime",
+    "depth": "max_depth",
+    "nodes": "nodes",
+    "mate": "mate",
+}
+GO_FLAGS = ("ponder", "infinite")
+
+
+def parse_go(parts, board: chess.Board) -> SearchLimits:
+    """go [wtime ..] [btime ..] ... [searchmoves m1 m2 ..] -> лимиты для SearchThread."""
+    limits = {}
+    i = 1
+    while i < len(parts):
+        token = parts[i]
+        if token in GO_INT_PARAMS:
+            try:
+                limits[GO_INT_PARAMS[token]] = int(parts[i + 1])
+                i += 2
+            except (IndexError, ValueError):
+                i += 1
+        elif token in GO_FLAGS:
+            limits[token] = True
+            i += 1
+        elif token == "searchmoves":
+            # ходы идут до следующего ключевого слова
+            moves = []
+            i += 1
+            while i < len(parts) and parts[i] not in GO_INT_PARAMS and parts[i] not in GO_FLAGS:
+                with contextlib.suppress(ValueError):
+                    moves.append(board.parse_uci(parts[i]))
+                i += 1
+            limits["search_moves"] = moves
+        else:
+            i += 1
+    return SearchLimits(**limits)
+
+
+# команды, на которые отвечаем, не дожидаясь python-chess и таблиц; isready ждёт загрузку —
+# после readyok движок должен быть готов к go
+UCI_EARLY_COMMANDS = ("uci", "setoption", "debug", "stop", "quit")
+
+
+def stop_search(search_thread, stop_event):
+    """
+    Останавливает поиск и ждёт поток без таймаута: только после этого можно чистить,
+    пересоздавать или освобождать TT и пул помощников, которыми он пользуется.
+    """
+    if search_thread and search_thread.is_alive():
+        stop_event.set()
+        search_thread.join()
+
+
+# диспетчер команд UCI: состояние сессии (доска, TT, пул, поток поиска) живёт в локальных переменных цикла
+def uci_loop():  # noqa: PLR0912, PLR0915
+    # python-chess и таблицы догружаются в фоне, пока GUI проходит рукопожатие uci/setoption
+    loader = threading.Thread(target=load_deferred, daemon=True)
+    loader.start()
+    board = None
+    chess960 = False
+    search_thread = None
+    stop_event = threading.Event()
+    tt = TranspositionTable(DEFAULT_HASH_MB)
+    threads = 1
+    move_overhead = DEFAULT_MOVE_OVERHEAD
+    multipv = 1
+    smp_pool = None
+    params = SearchParams()
+    state = SearchState(tt, params)
+    # номер партии: помощники Lazy SMP по нему понимают, что историю пора сбросить
+    game_id = 0
+    send_uci_id()
+
     while True:
         try:
             line = sys.stdin.readline()
@@ -423,96 +3203,106 @@ def uci_loop():
                 continue
             parts = line.split()
             cmd = parts[0]
+            if cmd not in UCI_EARLY_COMMANDS:
+                loader.join()
+                if board is None:
+                    board = chess.Board(chess960=chess960)
 
             if cmd == "uci":
-                print("id name DarkOnEngine")
-                print("id author Dark and Classic")
-                print("uciok")
-                sys.stdout.flush()
+                send_uci_id()
+            elif cmd == "setoption":
+                name, value = parse_setoption(parts)
+                if name and name.lower() in ("hash", "threads") and value:
+                    try:
+                        new_value = int(value)
+                    except ValueError:
+                        new_value = None
+                    if new_value is not None:
+                        stop_search(search_thread, stop_event)
+                        # помощники привязаны к сегменту общей памяти — пересоздадим при следующем go
+                        if smp_pool:
+                            smp_pool.close()
+                            smp_pool = None
+                        if name.lower() == "hash":
+                            tt.resize(new_value)
+                        else:
+                            threads = max(1, min(MAX_THREADS, new_value))
+                            if tt.shared != (threads > 1):
+                                tt.release()
+                                tt = TranspositionTable(tt.size_mb, shared=threads > 1)
+                                state.tt = tt
+                elif name and name.lower() == "move overhead" and value:
+                    with contextlib.suppress(ValueError):
+                        move_overhead = max(0, min(MAX_MOVE_OVERHEAD, int(value)))
+                elif name and name.lower() == "multipv" and value:
+                    with contextlib.suppress(ValueError):
+                        multipv = max(1, min(MAX_MULTIPV, int(value)))
+                elif name and name.lower() == "ponder":
+                    # ponder управляется командами go ponder / ponderhit, опция — только объявление
+                    pass
+                elif name and name.lower() == "uci_chess960" and value:
+                    chess960 = value.lower() == "true"
+                elif name and value is not None:
+                    params.set_option(name, value)
+            elif cmd == "debug":
+                # со следующего go в конце поиска печатаются счётчики SearchStats
+                state.debug = len(parts) > 1 and parts[1] == "on"
             elif cmd == "isready":
                 print("readyok")
                 sys.stdout.flush()
             elif cmd == "ucinewgame":
-                board = chess.Board()
+                stop_search(search_thread, stop_event)
+                if smp_pool:
+                    smp_pool.wait_idle()
+                state.clear()
+                game_id += 1
+                board = chess.Board(chess960=chess960)
             elif cmd == "position":
                 idx = 1
                 if len(parts) >= 2 and parts[1] == "startpos":
-                    board = chess.Board()
+                    board = chess.Board(chess960=chess960)
                     idx = 2
                 elif len(parts) >= 2 and parts[1] == "fen":
                     if len(parts) >= 8:
                         fen = " ".join(parts[2:8])
                         try:
-                            board = chess.Board(fen)
+                            board = chess.Board(fen, chess960=chess960)
                         except Exception:
-                            board = chess.Board()
+                            board = chess.Board(chess960=chess960)
                         idx = 8
                 if idx < len(parts) and parts[idx] == "moves":
                     for mv in parts[idx+1:]:
-                        try:
+                        with contextlib.suppress(Exception):
                             board.push_uci(mv)
-                        except Exception:
-                            pass
+            elif cmd == "go" and len(parts) > 2 and parts[1] == "perft":
+                stop_search(search_thread, stop_event)
+                with contextlib.suppress(ValueError):
+                    perft_divide(board, max(1, int(parts[2])))
             elif cmd == "go":
-                wtime = btime = winc = binc = movetime = None
-                depth = None
-                i = 1
-                while i < len(parts):
-                    if parts[i] == "wtime":
-                        try:
-                            wtime = int(parts[i+1]); i += 2
-                        except Exception:
-                            i += 1
-                    elif parts[i] == "btime":
-                        try:
-                            btime = int(parts[i+1]); i += 2
-                        except Exception:
-                            i += 1
-                    elif parts[i] == "winc":
-                        try:
-                            winc = int(parts[i+1]); i += 2
-                        except Exception:
-                            i += 1
-                    elif parts[i] == "binc":
-                        try:
-                            binc = int(parts[i+1]); i += 2
-                        except Exception:
-                            i += 1
-                    elif parts[i] == "movetime":
-                        try:
-                            movetime = int(parts[i+1]); i += 2
-                        except Exception:
-                            i += 1
-                    elif parts[i] == "depth":
-                        try:
-                            depth = int(parts[i+1]); i += 2
-                        except Exception:
-                            i += 1
-                    else:
-                        i += 1
+                limits = parse_go(parts, board)
 
                 # остановим предыдущий поиск, если есть
-                if search_thread and search_thread.is_alive():
-                    stop_event.set()
-                    search_thread.join(timeout=1.0)
-                    stop_event.clear()
+                stop_search(search_thread, stop_event)
+
+                if threads > 1 and smp_pool is None:
+                    smp_pool = SmpPool(threads - 1, tt)
 
                 stop_event = threading.Event()
-                search_thread = SearchThread(board, wtime=wtime, btime=btime, winc=winc or 0, binc=binc or 0, movetime=movetime, max_depth=depth, stop_event=stop_event)
+                search_thread = SearchThread(
+                    board, limits, stop_event=stop_event, state=state, smp_pool=smp_pool, game_id=game_id,
+                    move_overhead=move_overhead, multipv=multipv,
+                )
                 # запускаем асинхронно — поток сам выведет bestmove при завершении
                 search_thread.start()
-
+            elif cmd == "ponderhit":
+                if search_thread and search_thread.is_alive():
+                    search_thread.ponderhit()
 
             elif cmd == "stop":
-                if search_thread and search_thread.is_alive():
-                    stop_event.set()
-                    search_thread.join(timeout=2.0)
+                stop_search(search_thread, stop_event)
                 # Ничего дополнительно не печатаем — поток печатает bestmove при завершении
 
             elif cmd == "quit":
-                if search_thread and search_thread.is_alive():
-                    stop_event.set()
-                    search_thread.join(timeout=2.0)
                 break
             else:
                 pass
@@ -522,5 +3312,234 @@ def uci_loop():
             sys.stderr.flush()
             break
 
+    # конец ввода, quit или ошибка: поиск ещё может читать TT, освобождать её можно только после него
+    stop_search(search_thread, stop_event)
+    # помощники и сегмент общей памяти не должны пережить процесс
+    if smp_pool:
+        smp_pool.close()
+    tt.release()
+
+# ---- perft ----
+
+PERFT_CACHE_BITS = 18
+PERFT_CACHE_MASK = (1 << PERFT_CACHE_BITS) - 1
+PERFT_SUITE_DEPTH = 3
+# (FEN, chess960, число позиций на глубинах 1, 2, ...)
+PERFT_SUITE = [
+    # стартовая позиция
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", False, [20, 400, 8902, 197281, 4865609]),
+    # Kiwipete
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", False, [48, 2039, 97862, 4085603]),
+    # позиция 3 (CPW)
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", False, [14, 191, 2812, 43238, 674624]),
+    # позиция 4 (CPW)
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", False, [6, 264, 9467, 422333]),
+    # позиция 5 (CPW)
+    ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", False, [44, 1486, 62379, 2103487]),
+    # позиция 6 (CPW)
+    ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", False, [46, 2079, 89890, 3894594]),
+    # превращения
+    ("n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1", False, [24, 496, 9483, 182838]),
+    # взятие на проходе вскрывает шах
+    ("3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", False, [18, 92, 1670, 10138, 185429]),
+    # взятие на проходе с шахом
+    ("8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", False, [15, 126, 1928, 13931, 206379]),
+    # взятие на проходе связанной пешкой
+    ("8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", False, [13, 102, 1266, 10276, 135655]),
+    # рокировка с шахом
+    ("5k2/8/8/8/8/8/8/4K2R w K - 0 1", False, [15, 66, 1198, 6399, 120330]),
+    # превращение из-под шаха
+    ("2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", False, [11, 133, 1442, 19174, 266199]),
+    # слабое превращение
+    ("8/P1k5/K7/8/8/8/8/8 w - - 0 1", False, [6, 27, 273, 1329, 18135]),
+    # chess960
+    ("bqnb1rkr/pp3ppp/3ppn2/2p5/5P2/P2P4/NPP1P1PP/BQ1BNRKR w HFhf - 2 9", True, [21, 528, 12189, 326672]),
+    # chess960
+    ("2nnrbkr/p1qppppp/8/1ppb4/6PP/3PP3/PPP2P2/BQNNRBKR w HEhe - 1 9", True, [21, 807, 18002, 667366]),
+]
+
+
+def new_perft_cache() -> list:
+    return [None] * (1 << PERFT_CACHE_BITS)
+
+
+def perft(pos: Position, depth: int, cache: list | None = None) -> int:
+    """
+    Число позиций на глубине depth. Последний полуход не раскрывается: легальные ходы
+    просто считаются (bulk counting). cache — слоты (ключ, глубина, число) по младшим битам ключа.
+    """
+    moves = pos.pseudo_legal_moves()
+    if depth <= 1:
+        count = 0
+        for move in moves:
+            if pos.make(move):
+                pos.unmake(move)
+                count += 1
+        return count if depth == 1 else 1
+
+    if cache is not None:
+        idx = (pos.key ^ depth) & PERFT_CACHE_MASK
+        entry = cache[idx]
+        if entry is not None and entry[0] == pos.key and entry[1] == depth:
+            return entry[2]
+
+    count = 0
+    for move in moves:
+        if pos.make(move):
+            count += perft(pos, depth - 1, cache)
+            pos.unmake(move)
+    if cache is not None:
+        cache[idx] = (pos.key, depth, count)
+    return count
+
+
+def perft_divide(board: chess.Board, depth: int):
+    """go perft N: число позиций после каждого корневого хода, итог и скорость."""
+    pos = Position.from_board(board)
+    cache = new_perft_cache()
+    started = time.perf_counter_ns()
+    total = 0
+    for move in pos.legal_moves():
+        pos.make(move)
+        count = perft(pos, depth - 1, cache) if depth > 1 else 1
+        pos.unmake(move)
+        total += count
+        print(f"{pos.move_uci(move)}: {count}")
+    elapsed_ms = max(1, (time.perf_counter_ns() - started) // 1_000_000)
+    print(f"\nNodes searched: {total}")
+    print(f"info string perft depth {depth} nodes {total} time {elapsed_ms} nps {total * 1000 // elapsed_ms}")
+    sys.stdout.flush()
+
+
+def perft_suite(depth: int = PERFT_SUITE_DEPTH) -> bool:
+    """python DarkOnEngine.py perft [depth]: сверка генератора ходов с эталонными числами."""
+    ok = True
+    total = 0
+    started = time.perf_counter_ns()
+    cache = new_perft_cache()
+    for fen, chess960, counts in PERFT_SUITE:
+        pos = Position.from_board(chess.Board(fen, chess960=chess960))
+        for d, expected in enumerate(counts[:depth], 1):
+            count = perft(pos, d, cache)
+            total += count
+            status = "ok" if count == expected else f"FAIL (expected {expected})"
+            ok = ok and count == expected
+            print(f"{fen} depth {d}: {count} {status}")
+            sys.stdout.flush()
+    elapsed_ms = max(1, (time.perf_counter_ns() - started) // 1_000_000)
+    print(f"\nNodes: {total} time (ms): {elapsed_ms} nps: {total * 1000 // elapsed_ms}")
+    print("perft: all ok" if ok else "perft: FAILED")
+    return ok
+
+# ---- bench ----
+
+BENCH_DEPTH = 6
+# дебюты, миттельшпиль, тактика (WAC) и эндшпили; корень всегда с легальными ходами
+BENCH_FENS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 11",
+    "4rrk1/pp1n3p/3q2pQ/2p1pb2/2PP4/2P3N1/P2B2PP/4RRK1 b - - 7 19",
+    "rq3rk1/ppp2ppp/1bnpb3/3N2B1/3NP3/7P/PPPQ1PP1/2KR3R w - - 7 14",
+    "r1bq1r1k/1pp1n1pp/1p1p4/4p2Q/4Pp2/1BNP4/PPP2PPP/3R1RK1 w - - 2 14",
+    "r3r1k1/2p2ppp/p1p1bn2/8/1q2P3/2NPQN2/PPP3PP/R4RK1 b - - 2 15",
+    "r1bbk1nr/pp3p1p/2n5/1N4p1/2Np1B2/8/PPP2PPP/2KR1B1R w kq - 0 13",
+    "r1bq1rk1/ppp1nppp/4n3/3p3Q/3P4/1BP1B3/PP1N2PP/R4RK1 w - - 1 16",
+    "4r1k1/r1q2ppp/ppp2n2/4P3/5Rb1/1N1BQ3/PPP3PP/R5K1 w - - 1 17",
+    "2rqkb1r/ppp2p2/2npb1p1/1N1Nn2p/2P1PP2/8/PP2B1PP/R1BQK2R b KQ - 0 11",
+    "r1bq1r1k/b1p1npp1/p2p3p/1p6/3PP3/1B2NN2/PP3PPP/R2Q1RK1 w - - 1 16",
+    "3r1rk1/p5pp/bpp1pp2/8/q1PP1P2/b3P3/P2NQRPP/1R2B1K1 b - - 6 22",
+    "r1q2rk1/2p1bppp/2Pp4/p6b/Q1PNp3/4B3/PP1R1PPP/2K4R w - - 2 18",
+    "4k2r/1pb2ppp/1p2p3/1R1p4/3P4/2r1PN2/P4PPP/1R4K1 b - - 3 22",
+    "3q2k1/pb3p1p/4pbp1/2r5/PpN2N2/1P2P2P/5PP1/Q2R2K1 b - - 4 26",
+    "6k1/6p1/6Pp/ppp5/3pn2P/1P3K2/1PP2P2/8 b - - 0 1",
+    "8/8/8/8/5kp1/P7/8/1K1N4 w - - 0 1",
+    "8/8/8/5N2/8/p7/8/2NK3k w - - 0 1",
+    "8/4k3/8/8/8/4B3/4KN2/8 w - - 0 1",
+    "8/8/1P6/5pr1/8/4R3/7k/2K5 w - - 0 1",
+    "8/2p4P/8/kr6/6R1/8/8/1K6 w - - 0 1",
+    "8/8/3P3k/8/1p6/8/1P6/1K3n2 b - - 0 1",
+    "8/R7/2q5/8/6k1/8/1P5p/K6R w - - 0 124",
+    "6k1/3b3r/1p1p4/p1n2p2/1PPNpP1q/P3Q1p1/1R1RB1P1/5K2 b - - 0 1",
+    "r2r1n2/pp2bk2/2p1p2p/3q4/3PN1QP/2P3R1/P4PP1/5RK1 w - - 0 1",
+    "3r1k2/4npp1/1ppr3p/p6P/P2PPPP1/1NR5/5K2/2R5 w - - 0 1",
+    "2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - 0 1",
+    "8/7p/5k2/5p2/p1p2P2/Pr1pPK2/1P1R3P/8 b - - 0 1",
+    "5rk1/1ppb3p/p1pb4/6q1/3P1p1r/2P1R2P/PP1BQ1P1/5RKN w - - 0 1",
+    "r1bq2rk/pp3pbp/2p1p1pQ/7P/3P4/2PB1N2/PP3PPR/2KR4 w - - 0 1",
+    "5k2/6pp/p1qN4/1p1p4/3P4/2PKP2Q/PP3r2/3R4 b - - 0 1",
+    "7k/p7/1R5K/6r1/6p1/6P1/8/8 w - - 0 1",
+    "rnbqkb1r/pppp1ppp/8/4P3/6n1/7P/PPPNPPP1/R1BQKBNR b KQkq - 0 1",
+    "r4q1k/p2bR1rp/2p2Q1N/5p2/5p2/2P5/PP3PPP/R5K1 w - - 0 1",
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2",
+    "rnbqkb1r/pppp1ppp/5n2/4p3/4P3/2N5/PPPP1PPP/R1BQKBNR w KQkq - 2 3",
+    "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3",
+    "rnbqkb1r/ppp1pppp/5n2/3p4/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 1 3",
+    "rnbqk2r/pppp1ppp/4pn2/8/1bPP4/2N5/PP2PPPP/R1BQKBNR w KQkq - 2 4",
+    "rnbqkbnr/pp2pppp/3p4/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 0 3",
+    "r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/2P2N2/PP1P1PPP/RNBQK2R w KQkq - 3 5",
+    "rnbqkbnr/ppp2ppp/4p3/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq d6 0 3",
+    "8/8/4k3/8/2p5/8/B2K4/8 w - - 0 1",
+    "8/5k2/8/3K4/8/8/4P3/8 w - - 0 1",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+    "8/8/8/4k3/8/8/3QK3/8 w - - 0 1",
+    "8/6pk/8/8/8/8/6PK/5R2 w - - 0 1",
+    "r1b1k2r/ppppnppp/2n2q2/2b5/3NP3/2P1B3/PP3PPP/RN1QKB1R w KQkq - 0 1",
+    "2r3k1/1q2bpp1/p3p2p/1p1pP3/3P4/1P1Q1N1P/P4PP1/2R3K1 w - - 0 1",
+]
+
+
+def bench(depth: int = BENCH_DEPTH, threads: int = 1):
+    """
+    python DarkOnEngine.py bench [depth] [threads]: поиск на фиксированную глубину по BENCH_FENS.
+    Вывод поиска — в stdout, итог — в stderr. Сигнатура — свёртка узлов по позициям: в одном потоке
+    она детерминирована и меняется, только если изменилось поведение поиска.
+    """
+    tt = TranspositionTable(DEFAULT_HASH_MB, shared=threads > 1)
+    state = SearchState(tt)
+    smp_pool = SmpPool(threads - 1, tt) if threads > 1 else None
+    total_nodes = 0
+    signature = 0
+    started = time.perf_counter_ns()
+    try:
+        for game_id, fen in enumerate(BENCH_FENS, 1):
+            print(f"\nPosition: {game_id}/{len(BENCH_FENS)} {fen}", file=sys.stderr)
+            sys.stderr.flush()
+            # каждая позиция — отдельная партия: результат не зависит от порядка позиций
+            state.clear()
+            search_thread = SearchThread(
+                chess.Board(fen), SearchLimits(max_depth=depth), state=state, smp_pool=smp_pool, game_id=game_id
+            )
+            search_thread.run()
+            nodes = state.nodes
+            if smp_pool:
+                smp_pool.wait_idle()
+                nodes += smp_pool.helper_nodes
+            total_nodes += nodes
+            signature = (signature * 31 + nodes) & 0xFFFFFFFF
+    finally:
+        if smp_pool:
+            smp_pool.close()
+        tt.release()
+
+    elapsed_ms = max(1, (time.perf_counter_ns() - started) // 1_000_000)
+    print("\n===========================", file=sys.stderr)
+    print(f"Total time (ms) : {elapsed_ms}", file=sys.stderr)
+    print(f"Nodes searched  : {total_nodes}", file=sys.stderr)
+    print(f"Nodes/second    : {total_nodes * 1000 // elapsed_ms}", file=sys.stderr)
+    print(f"Node signature  : {signature:08x}", file=sys.stderr)
+    sys.stderr.flush()
+
+
 if __name__ == "__main__":
-    uci_loop()
+    if len(sys.argv) > 1 and sys.argv[1] in ("perft", "bench"):
+        load_deferred()
+    if len(sys.argv) > 1 and sys.argv[1] == "perft":
+        sys.exit(0 if perft_suite(int(sys.argv[2]) if len(sys.argv) > 2 else PERFT_SUITE_DEPTH) else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == "bench":
+        bench(
+            int(sys.argv[2]) if len(sys.argv) > 2 else BENCH_DEPTH,
+            max(1, min(MAX_THREADS, int(sys.argv[3]))) if len(sys.argv) > 3 else 1,
+        )
+    else:
+        uci_loop()
@@ -5,15 +5,17 @@ from api import API
 from botli_dataclasses import GameInformation
 from chatter import Chatter
 from config import Config
+from engine import EnginePool
 from lichess_game import LichessGame
 
 
 class Game:
-    def __init__(self, api: API, config: Config, username: str, game_id: str) -> None:
+    def __init__(self, api: API, config: Config, username: str, game_id: str, engine_pool: EnginePool) -> None:
         self.api = api
         self.config = config
         self.username = username
         self.game_id = game_id
+        self.engine_pool = engine_pool
 
         self.takeback_count = 0
         self.was_aborted = False
@@ -26,7 +28,7 @@ class Game:
         game_stream_queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
         self._task = asyncio.create_task(self.api.get_game_stream(self.game_id, game_stream_queue))
         info = GameInformation.from_game_full_event(await game_stream_queue.get())
-        lichess_game = await LichessGame.acreate(self.api, self.config, self.username, info)
+        lichess_game = await LichessGame.acreate(self.api, self.config, self.username, info, self.engine_pool)
         chatter = Chatter(self.api, self.config, self.username, info, lichess_game)
 
         self._print_game_information(info)
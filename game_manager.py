@@ -7,6 +7,7 @@ from api import API
 from botli_dataclasses import Challenge, ChallengeRequest, Tournament, TournamentRequest
 from challenger import Challenger
 from config import Config
+from engine import EnginePool
 from game import Game
 from matchmaking import Matchmaking
 from utils import get_future_timestamp
@@ -20,6 +21,7 @@ class GameManager:
 
         self.challenger = Challenger(api)
         self.changed_event = Event()
+        self.engine_pool = EnginePool()
         self.matchmaking = Matchmaking(api, config, username)
 
         self.challenge_requests: deque[ChallengeRequest] = deque()
@@ -81,6 +83,8 @@ class GameManager:
         for task in list(self.tasks):
             await task
 
+        await self.engine_pool.close()
+
     @property
     def is_busy(self) -> bool:
         return len(self.tasks) + len(self.tournaments) + self.reserved_game_spots >= self.config.challenge.concurrency
@@ -240,7 +244,7 @@ class GameManager:
             self.tournaments[tournament.id_] = tournament
             print(f'External joined tournament "{tournament.name}" detected.')
 
-        game = Game(self.api, self.config, self.username, game_event["id"])
+        game = Game(self.api, self.config, self.username, game_event["id"], self.engine_pool)
         task = asyncio.create_task(game.run())
         task.add_done_callback(self._task_callback)
         self.tasks[task] = game
@@ -26,7 +26,7 @@ from botli_dataclasses import (
 )
 from config import Config
 from configs import EngineConfig, SyzygyConfig
-from engine import Engine
+from engine import Engine, EnginePool
 from enums import Variant
 
 
@@ -41,6 +41,7 @@ class LichessGame:
         syzygy_config: SyzygyConfig,
         engine_key: str,
         engine: Engine,
+        engine_pool: EnginePool,
     ) -> None:
         self.api = api
         self.config = config
@@ -66,22 +67,26 @@ class LichessGame:
         self.out_of_chessdb_counter = 0
         self.move_overhead = self._get_move_overhead(config.engines[engine_key])
         self.engine = engine
+        self.engine_pool = engine_pool
         self.scores: list[chess.engine.PovScore] = []
         self.last_message = "No eval available yet."
         self.last_pv: list[chess.Move] = []
 
     @classmethod
-    async def acreate(cls, api: API, config: Config, username: str, game_info: GameInformation) -> "LichessGame":
+    async def acreate(
+        cls, api: API, config: Config, username: str, game_info: GameInformation, engine_pool: EnginePool
+    ) -> "LichessGame":
         board = cls._get_board(game_info)
         is_white = game_info.white_name == username
         engine_key = cls._get_engine_key(config, board, is_white, game_info)
         syzygy_config = cls._get_syzygy_config(config, board)
-        engine = await Engine.from_config(
+        engine = await engine_pool.checkout(
+            engine_key,
             config.engines[engine_key],
             syzygy_config,
             game_info.black_opponent if is_white else game_info.white_opponent,
         )
-        return cls(api, config, username, game_info, board, syzygy_config, engine_key, engine)
+        return cls(api, config, username, game_info, board, syzygy_config, engine_key, engine, engine_pool)
 
     @staticmethod
     def _get_board(game_info: GameInformation) -> chess.Board:
@@ -249,7 +254,7 @@ class LichessGame:
         await self.engine.start_pondering(self.board)
 
     async def close(self) -> None:
-        await self.engine.close()
+        await self.engine_pool.checkin(self.engine)
 
         for book_reader in self.book_settings.readers.values():
             book_reader.close()
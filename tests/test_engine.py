@@ -0,0 +1,36 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+ENGINE_PATH = Path(__file__).resolve().parent.parent / "engines" / "DarkOnEngine.py"
+
+# single-threaded bench at depth 3; update only together with an intended change of search behaviour
+BENCH_DEPTH = 3
+BENCH_NODES = 48829
+BENCH_SIGNATURE = "f9721a7b"
+
+
+@pytest.fixture(scope="module")
+def engine():
+    spec = importlib.util.spec_from_file_location("DarkOnEngine", ENGINE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    module.load_deferred()
+    yield module
+    sys.modules.pop(spec.name, None)
+
+
+@pytest.mark.parametrize("depth", [2, 3])
+def test_perft_suite(engine, depth: int, capsys: pytest.CaptureFixture[str]):
+    assert engine.perft_suite(depth)
+    assert "FAIL" not in capsys.readouterr().out
+
+
+def test_bench_signature(engine, capsys: pytest.CaptureFixture[str]):
+    engine.bench(BENCH_DEPTH)
+    err = capsys.readouterr().err
+    assert f"Nodes searched  : {BENCH_NODES}\n" in err
+    assert f"Node signature  : {BENCH_SIGNATURE}\n" in err